@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# none of these may be imported by `import osintflow.core` alone
+BACKENDS = ['pandas', 'sqlalchemy', 'pangres', 'minio', 'pymongo', 'chardet', 'requests', 'deepdiff']
+
+
+def import_times(module):
+    # one fresh interpreter per sample; returns {module: cumulative microseconds} parsed from -X importtime
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def loaded_backends(module):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    code = f'import sys, {module}; print(" ".join(m for m in {BACKENDS!r} if m in sys.modules))'
+    completed = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return completed.stdout.split()
+
+
+def run(module, repeat, top):
+    samples = [import_times(module) for _ in range(repeat)]
+    total = statistics.median(sample[module] for sample in samples) / 1000
+    heaviest = sorted(samples[-1].items(), key=lambda item: item[1], reverse=True)[:top]
+    return total, heaviest, loaded_backends(module)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="import time of osintflow.core (python -X importtime)")
+    parser.add_argument("--module", default="osintflow.core")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    total, heaviest, backends = run(args.module, args.repeat, args.top)
+    print(f"{args.module}: {total:.1f}ms (median of {args.repeat})")
+    for name, cumulative in heaviest:
+        print(f"{cumulative / 1000:10.1f}ms  {name}")
+    if backends:
+        print("eagerly imported backends: " + ", ".join(backends))
+    if backends or (args.max_ms is not None and total > args.max_ms):
+        sys.exit(1)
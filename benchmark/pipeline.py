@@ -0,0 +1,319 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from unittest import mock
+
+import pymongo
+import requests
+import sqlalchemy
+
+import server
+import synthetic
+from osintflow import encoding, ioc, metrics
+from osintflow.core import osint
+from osintflow.dedupe import Deduplicator
+from osintflow.mongo import ops as mongo_ops
+from osintflow.mysql import ops as mysql_ops
+from osintflow.stream import Map
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentiles(values) -> dict:
+    ordered = sorted(values)
+
+    def at(q):
+        # linear interpolation between closest ranks
+        position = (len(ordered) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    return {"min": ordered[0], "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": ordered[-1],
+            "mean": statistics.fmean(ordered)}
+
+
+def measure(setup, run, repeat, warmup=1, unit='records'):
+    # setup() builds the input outside the timed section; run(input) returns the number of records handled.
+    # peak memory comes from one extra run under tracemalloc so tracing never slows the timed runs down
+    latencies = []
+    records = 0
+    for i in range(warmup + repeat):
+        argument = setup()
+        gc.collect()
+        start = time.perf_counter()
+        records = run(argument)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            latencies.append(elapsed)
+    argument = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    latency = percentiles(latencies)
+    return {unit: records, "unit": unit, "throughput_rps": records / latency['p50'] if latency['p50'] else 0.0,
+            "latency": latency, "peak_memory_mb": peak / 2 ** 20}
+
+
+def wrap(obj):
+    return {"id": obj['id'], "custom_raw_data": obj}
+
+
+def ioc_row(ioc):
+    return {"id": ioc['id'], "ioc": ioc['ioc'], "ioc_type": ioc['ioc_type'], "malware": ioc['malware'],
+            "confidence_level": ioc['confidence_level'], "first_seen": ioc['first_seen']}
+
+
+class Environment:
+    # local stand-ins: the synthetic HTTP server, mongomock (or a real server with mongo_uri) and a SQLite file
+    # per run. mongomock upserts scan the whole collection, so Mongo write numbers are only comparable between
+    # runs against the same backend
+    def __init__(self, objects, duplicate_ratio, mongo_uri=None):
+        self.objects = objects
+        self.base_url, self._server = server.start()
+        self.attack_url = f"{self.base_url}/attack?objects={objects}"
+        self.threatfox_url = f"{self.base_url}/threatfox?objects={objects}&duplicate_ratio={duplicate_ratio}"
+        self._patch = None
+        if mongo_uri is None:
+            try:
+                import mongomock
+            except ImportError:
+                raise SystemExit("mongomock is needed without --mongo-uri: pip install -e .[benchmark]")
+            self.client = mongomock.MongoClient()
+            self._patch = mock.patch.object(pymongo, 'MongoClient', lambda *args, **kwargs: self.client)
+            self._patch.start()
+        else:
+            self.client = pymongo.MongoClient(mongo_uri)
+        self._directory = tempfile.TemporaryDirectory()
+        self._sqlite_files = 0
+        self.mongo = {"mongodb_uri": mongo_uri or "mongodb://benchmark", "mongodb_database": "osintflow_benchmark",
+                      "mongodb_collection": "records", "mongodb_compare_field": "id"}
+
+    def collection(self):
+        # an empty collection for every run, so every run inserts the same documents
+        database = self.client[self.mongo['mongodb_database']]
+        database.drop_collection('records')
+        return database['records']
+
+    def mysql(self) -> dict:
+        self._sqlite_files += 1
+        return {"mysql_url": f"sqlite:///{self._directory.name}/run{self._sqlite_files}.db", "mysql_table": "iocs"}
+
+    def close(self):
+        if self._patch is not None:
+            self._patch.stop()
+        else:
+            self.client.drop_database(self.mongo['mongodb_database'])
+            self.client.close()
+        self._server.shutdown()
+        self._directory.cleanup()
+
+
+def stage_benchmarks(env, repeat):
+    session = requests.Session()
+    attack_body = session.get(env.attack_url).content
+    threatfox_body = session.get(env.threatfox_url).content
+    attack_objects = json.loads(attack_body)['objects']
+    threatfox_rows = [ioc_row(ioc) for ioc in json.loads(threatfox_body)['data']]
+    documents = [wrap(obj) for obj in attack_objects]
+    handlers = (lambda body: body['objects'], Map(wrap), list)
+
+    def fetch(_):
+        return len(session.get(env.attack_url).content)
+
+    def bulk_load(engine):
+        return mysql_ops.bulk_load(threatfox_rows, engine, 'iocs', compare_field='id')['rows']
+
+    report = synthetic.ioc_text(env.objects * 1024).encode('utf-8')
+
+    def commit_now(hook):
+        # nothing is stored here, the IOCs go into the seen-set right away
+        hook()
+        return True
+
+    def extract_iocs(seen):
+        ioc.ExtractIOCs(seen=seen, on_commit=commit_now)(report)
+        return len(report)
+
+    stages = OrderedDict()
+    # fetch, decode and ioc_extract count bytes rather than records
+    stages['fetch'] = measure(lambda: None, fetch, repeat, unit='bytes')
+    stages['decode'] = measure(lambda: attack_body,
+                               lambda body: len(encoding.decode(body, 'application/json', env.attack_url)[0]),
+                               repeat, unit='bytes')
+    stages['parse'] = measure(lambda: attack_body, lambda body: len(json.loads(body)['objects']), repeat)
+    stages['handle'] = measure(lambda: json.loads(attack_body), lambda data: len(osint._handle(data, *handlers)),
+                               repeat)
+    stages['dedupe'] = measure(lambda: [wrap(ioc) for ioc in json.loads(threatfox_body)['data']],
+                               lambda docs: len(Deduplicator()(docs)), repeat)
+    stages['upsert_or_revoke'] = measure(
+        env.collection,
+        lambda collection: mongo_ops.upsert_or_revoke(documents, collection, 'id').upserted_count, repeat)
+    stages['mysql_bulk_load'] = measure(lambda: sqlalchemy.create_engine(env.mysql()['mysql_url']), bulk_load,
+                                        repeat)
+    stages['ioc_extract'] = measure(lambda: None, extract_iocs, repeat, unit='bytes')
+    # a fresh seen-set per run, so every run adds the same IOCs to it
+    stages['ioc_extract_seen'] = measure(ioc.BloomFilter, extract_iocs, repeat, unit='bytes')
+    return stages
+
+
+def pipeline_jobs(env) -> OrderedDict:
+    # (setup, job) pairs; every job runs the full decorator chain against the local stand-ins
+    @osint.source_web(env.attack_url)
+    @osint.dataflow(json.loads, lambda body: [wrap(obj) for obj in body['objects']])
+    @osint.store_mongo(env.mongo)
+    def attack_to_mongo():
+        return osint.data
+
+    @osint.source_web(env.attack_url, stream='json', items='objects')
+    @osint.dataflow(Map(wrap))
+    @osint.store_mongo(dict(env.mongo, mongodb_chunk_size=1000))
+    def attack_stream_to_mongo():
+        return osint.data
+
+    @osint.source_web(env.threatfox_url)
+    @osint.dataflow(json.loads, lambda body: [wrap(ioc) for ioc in body['data']])
+    @osint.store_mongo(dict(env.mongo, mongodb_fingerprint_field=mongo_ops.DEFAULT_FINGERPRINT_FIELD))
+    def threatfox_to_mongo():
+        return osint.data
+
+    def threatfox_to_mysql(configure):
+        @osint.source_web(env.threatfox_url)
+        @osint.dataflow(json.loads, lambda body: [ioc_row(ioc) for ioc in body['data']])
+        @osint.store_mysql(configure, compare_field='id', bulk=True)
+        def job():
+            return osint.data
+
+        return job()
+
+    return OrderedDict([
+        ('attack_to_mongo', (env.collection, lambda _: attack_to_mongo())),
+        ('attack_stream_to_mongo', (env.collection, lambda _: attack_stream_to_mongo())),
+        ('threatfox_to_mongo', (env.collection, lambda _: threatfox_to_mongo())),
+        ('threatfox_to_mysql', (env.mysql, threatfox_to_mysql)),
+    ])
+
+
+def pipeline_benchmarks(env, repeat):
+    # end-to-end runs; the per-stage breakdown comes from the osintflow.metrics instrumentation
+    reports = []
+    results = OrderedDict()
+    for name, (setup, job) in pipeline_jobs(env).items():
+        def run(argument):
+            reports.clear()
+            metrics.enable(reports.append)
+            try:
+                job(argument)
+            finally:
+                metrics.disable()
+            stages = reports[-1]['stages']
+            sink = stages.get('store_mongo') or stages.get('store_mysql')
+            return sink['records_in']
+
+        stage_runs = []
+
+        def collect(argument):
+            records = run(argument)
+            stage_runs.append(reports[-1]['stages'])
+            return records
+
+        result = measure(setup, collect, repeat)
+        # drop the warmup and the tracemalloc run
+        stage_runs = stage_runs[1:repeat + 1]
+        result['stages'] = OrderedDict(
+            (stage, {"seconds": percentiles([run_stages[stage]['seconds'] for run_stages in stage_runs]),
+                     "records_in": stage_runs[-1][stage]['records_in'],
+                     "records_out": stage_runs[-1][stage]['records_out'],
+                     "bytes_in": stage_runs[-1][stage]['bytes_in']})
+            for stage in stage_runs[-1])
+        results[name] = result
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline['revision']} ({baseline_path})")
+    if baseline['parameters'] != current['parameters']:
+        print(f"WARNING: parameters differ: {baseline['parameters']}")
+    for group in ('stages', 'pipelines'):
+        for name, result in current[group].items():
+            previous = baseline.get(group, {}).get(name)
+            if previous is None:
+                continue
+            speedup = previous['latency']['p50'] / result['latency']['p50'] if result['latency']['p50'] else 0.0
+            memory = result['peak_memory_mb'] - previous['peak_memory_mb']
+            print(f"{name:>24}: p50 x{speedup:5.2f}  peak memory {memory:+8.1f}MB")
+
+
+def print_results(results):
+    for group in ('stages', 'pipelines'):
+        print(f"\n{group}")
+        for name, result in results[group].items():
+            latency = result['latency']
+            if result['unit'] == 'bytes':
+                throughput = f"{result['throughput_rps'] / 2 ** 20:12.1f}MB/s"
+            else:
+                throughput = f"{result['throughput_rps']:12.0f}/s  "
+            print(f"{name:>24}: {throughput}  p50 {latency['p50'] * 1000:9.1f}ms  "
+                  f"p90 {latency['p90'] * 1000:9.1f}ms  p99 {latency['p99'] * 1000:9.1f}ms  "
+                  f"peak {result['peak_memory_mb']:8.1f}MB")
+            for stage, totals in result.get('stages', {}).items():
+                print(f"{'':>26}{stage:<22} p50 {totals['seconds']['p50'] * 1000:9.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="osintflow stages and pipelines against local stand-ins "
+                                                 "(HTTP server, mongomock, SQLite)")
+    parser.add_argument("--objects", type=int, default=1000, help="objects / IOCs per synthetic payload")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo-uri", default=None, help="use this MongoDB instead of mongomock")
+    parser.add_argument("--output", default=None, help="JSON file (default: results/<git revision>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    env = Environment(args.objects, args.duplicate_ratio, args.mongo_uri)
+    try:
+        results = {
+            "revision": git_revision(),
+            "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {"objects": args.objects, "duplicate_ratio": args.duplicate_ratio, "repeat": args.repeat,
+                           "mongo": "mongomock" if args.mongo_uri is None else "mongodb"},
+            "stages": stage_benchmarks(env, args.repeat),
+            "pipelines": pipeline_benchmarks(env, args.repeat),
+        }
+    finally:
+        env.close()
+
+    print_results(results)
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nsaved {output}")
+    if args.compare:
+        compare(results, args.compare)
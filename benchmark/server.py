@@ -0,0 +1,114 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic import attack_bundle, threatfox_response
+
+
+@lru_cache(maxsize=32)
+def _payload(path, objects, seed, duplicate_ratio):
+    # payloads are generated once per parameter set, so the server itself stays out of the measurements
+    if path == '/attack':
+        return json.dumps(attack_bundle(objects, seed)).encode('utf-8')
+    if path == '/threatfox':
+        return json.dumps(threatfox_response(objects, seed, duplicate_ratio)).encode('utf-8')
+    return None
+
+
+@lru_cache(maxsize=32)
+def _iocs(objects, seed):
+    return [dict(ioc, id=str(i)) for i, ioc in enumerate(threatfox_response(objects, seed, duplicate_ratio=0)['data'])]
+
+
+def _page(path, query):
+    # paginated ThreatFox stand-ins over one fixed list of `objects` IOCs
+    objects = int(query.get('objects', '1000'))
+    if path == '/threatfox/offset':
+        offset, limit = int(query.get('offset', '0')), int(query.get('limit', '100'))
+        return {"query_status": "ok", "data": _iocs(objects, 0)[offset:offset + limit]}
+    if path == '/threatfox/cursor':
+        offset, limit = int(query.get('cursor', '0')), int(query.get('limit', '100'))
+        following = offset + limit if offset + limit < objects else None
+        return {"query_status": "ok", "data": _iocs(objects, 0)[offset:offset + limit],
+                "next": str(following) if following is not None else None}
+    if path == '/threatfox/window':
+        # `objects` IOCs per day in [from, to)
+        since = datetime.strptime(query['from'], '%Y-%m-%d')
+        until = datetime.strptime(query['to'], '%Y-%m-%d')
+        return {"query_status": "ok",
+                "data": [dict(ioc, id=f"{day}-{ioc['id']}", first_seen=f"{day} 00:00:00 UTC")
+                         for ordinal in range(since.toordinal(), until.toordinal())
+                         for day in [datetime.fromordinal(ordinal).strftime('%Y-%m-%d')]
+                         for ioc in _iocs(objects, ordinal)]}
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # GET /attack?objects=N&seed=S  -> ATT&CK-shaped bundle
+    # GET /threatfox?objects=N&seed=S&duplicate_ratio=R  -> ThreatFox-shaped API response
+    # GET /threatfox/offset?offset=&limit=, /threatfox/cursor?cursor=&limit=, /threatfox/window?from=&to=
+    #     -> pages; any request also takes latency=<seconds> and flaky=<ratio of 503 responses>
+    # GET /headers  -> the request headers as JSON; any request also takes set_cookie=<name=value>
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        time.sleep(float(query.get('latency', '0')))
+        if random.random() < float(query.get('flaky', '0')):
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        page = _page(url.path, query)
+        if url.path == '/headers':
+            body = json.dumps(dict(self.headers)).encode('utf-8')
+        elif page is not None:
+            body = json.dumps(page).encode('utf-8')
+        else:
+            body = _payload(url.path, int(query.get('objects', '1000')), int(query.get('seed', '0')),
+                            float(query.get('duplicate_ratio', '0.1')))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'set_cookie' in query:
+            self.send_header('Set-Cookie', query['set_cookie'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+
+def start(host='127.0.0.1', port=0):
+    # returns (base url, server); server.shutdown() stops it
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='benchmark_server').start()
+    return f"http://{host}:{server.server_address[1]}", server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="serve synthetic ATT&CK / ThreatFox payloads")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    base_url, server = start(port=args.port)
+    print(f"serving {base_url}/attack, {base_url}/threatfox and {base_url}/threatfox/{{offset,cursor,window}}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
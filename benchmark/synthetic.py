@@ -0,0 +1,77 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+TACTICS = ["reconnaissance", "initial-access", "execution", "persistence", "privilege-escalation",
+           "defense-evasion", "credential-access", "discovery", "lateral-movement", "collection",
+           "command-and-control", "exfiltration", "impact"]
+
+
+def attack_object(i, rng=random):
+    created = datetime(2017, 5, 31) + timedelta(days=rng.randint(0, 2500))
+    return {
+        "type": "attack-pattern",
+        "id": f"attack-pattern--{uuid.UUID(int=i)}",
+        "created": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "modified": (created + timedelta(days=rng.randint(0, 400))).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "name": f"Technique {i}",
+        "description": " ".join(rng.choice(["adversaries", "may", "abuse", "the", "system", "to", "execute",
+                                            "commands", "payloads", "scripts", "binaries"]) for _ in range(80)),
+        "kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": rng.choice(TACTICS)}
+                              for _ in range(rng.randint(1, 3))],
+        "external_references": [{"source_name": "mitre-attack", "external_id": f"T{1000 + i}",
+                                 "url": f"https://attack.mitre.org/techniques/T{1000 + i}"}],
+        "x_mitre_platforms": rng.sample(["Windows", "Linux", "macOS", "Network", "Containers"], 2),
+        "x_mitre_version": f"{rng.randint(1, 3)}.{rng.randint(0, 4)}",
+    }
+
+
+def attack_bundle(objects=20000, seed=0):
+    rng = random.Random(seed)
+    return {"type": "bundle", "id": f"bundle--{uuid.UUID(int=seed)}", "spec_version": "2.0",
+            "objects": [attack_object(i, rng) for i in range(objects)]}
+
+
+def threatfox_response(iocs=20000, seed=0, duplicate_ratio=0.1):
+    rng = random.Random(seed)
+    data = []
+    for i in range(iocs):
+        n = rng.randrange(int(iocs * (1 - duplicate_ratio)) or 1)
+        ip = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{n % 256}"
+        data.append({
+            "id": str(n),
+            "ioc": f"{ip}:{rng.randint(1, 65535)}" if n % 2 else f"malicious-{n}.example.com",
+            "ioc_type": "ip:port" if n % 2 else "domain",
+            "threat_type": "botnet_cc",
+            "malware": rng.choice(["win.cobalt_strike", "win.qakbot", "elf.mirai", "win.emotet"]),
+            "confidence_level": rng.choice([50, 75, 100]),
+            "first_seen": "2026-10-17 12:00:00 UTC",
+            "tags": rng.sample(["c2", "botnet", "loader", "rat", "stealer"], 2),
+            "reporter": "abuse_ch",
+        })
+    return {"query_status": "ok", "data": data}
+
+
+def ioc_text(size=1024 * 1024, seed=0, ioc_ratio=0.05):
+    # HTML-ish threat report text of about `size` bytes; roughly ioc_ratio of the tokens are IOCs, some defanged
+    rng = random.Random(seed)
+    words = ["the", "actor", "deployed", "a", "loader", "which", "contacted", "its", "server", "over", "port",
+             "443", "after", "execution", "of", "payload.exe", "version", "2.1.0", "<p>", "</p>", "<br>"]
+    iocs = [
+        lambda: f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+        lambda: f"{rng.randint(1, 223)}[.]{rng.randint(0, 255)}[.]{rng.randint(0, 255)}[.]{rng.randint(1, 254)}",
+        lambda: f"malicious-{rng.randrange(10 ** 6)}.example.com",
+        lambda: f"update-{rng.randrange(10 ** 6)}[.]badsite[.]net",
+        lambda: f"https://cdn-{rng.randrange(10 ** 6)}.example.org/gate.php?id={rng.randrange(10 ** 9)}",
+        lambda: f"hxxp://{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.1/bins/x86",
+        lambda: "%032x" % rng.getrandbits(128),
+        lambda: "%040x" % rng.getrandbits(160),
+        lambda: "%064x" % rng.getrandbits(256),
+    ]
+    tokens = []
+    length = 0
+    while length < size:
+        token = rng.choice(iocs)() if rng.random() < ioc_ratio else rng.choice(words)
+        tokens.append(token)
+        length += len(token) + 1
+    return " ".join(tokens)
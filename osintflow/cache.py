@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import osintflow.config as config
+import osintflow.util as util
+
+
+class ResponseCache:
+    # keeps only validators (ETag / Last-Modified) and a content hash per request, not the bodies themselves:
+    # an unchanged response short-circuits the whole job, so nothing downstream ever needs the old body
+    def __init__(self, directory, max_entries=None):
+        self.directory = directory
+        self.max_entries = max_entries or config.response_cache_size
+        self._path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self._path):
+            with open(self._path, 'r') as f:
+                self._entries = OrderedDict(json.load(f))
+
+    @staticmethod
+    def key(method, url, data=None, params=None):
+        return util.content_hash([method.lower(), url, data, params])
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+    def conditional_headers(self, key) -> dict:
+        with self._lock:
+            entry = self._entries.get(key)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_unchanged(self, key, response, content_hash=None) -> bool:
+        if response.status_code == 304:
+            return True
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and content_hash is not None and entry.get('content_hash') == content_hash
+
+    def update(self, key, response, content_hash=None):
+        # called only after the downstream chain succeeded, so a failed run is fetched in full next time
+        with self._lock:
+            entry = self._entries.pop(key, {})
+            if response.status_code != 304:
+                entry = {"etag": response.headers.get('ETag'),
+                         "last_modified": response.headers.get('Last-Modified'),
+                         "content_hash": content_hash}
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(tmp_path, self._path)
+
+
+class _ResponseCacheRegistry:
+    # one ResponseCache per directory for the whole process: every entry lives in one shared index.json, so
+    # separate instances over the same directory would overwrite each other's validators on save
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches = {}
+
+    def get(self, directory, max_entries=None) -> ResponseCache:
+        key = os.path.realpath(directory)
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = self._caches[key] = ResponseCache(directory, max_entries)
+            return cache
+
+
+_registry = _ResponseCacheRegistry()
+get = _registry.get
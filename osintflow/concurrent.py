@@ -1,33 +1,278 @@
+import atexit
+import functools
+import importlib
+import queue
+import threading
+import time
 import traceback
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 
 import osintflow.config as config
+import osintflow.util as util
+
+
+class _Task:
+    def __init__(self, func, args, kwargs, source, callback):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.source = source
+        self.callback = callback
+        self.future = Future()
+        self.submitted = time.perf_counter()
 
 
 class _Concurrent:
-    def __init__(self):
-        self.pool = ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix='osintflow_concurrent_')
+    # long-lived worker pool: bounded queue (submit blocks when it is full, tasks parked behind the limit of
+    # their source included), optional concurrency limits per source, and a drain-only wait so the pool can be
+    # reused for the whole life of a collector. The workers start on the first submit, so importing osintflow
+    # starts no threads (a process pool forked later would otherwise inherit locks held by them)
+    def __init__(self, max_workers=None, max_queue_size=None):
+        # the slots bound queued and parked tasks together; the queue itself also carries worker stop markers
+        self._slots = threading.BoundedSemaphore(max_queue_size or config.max_queue_size)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._worker_count = 0
+        self._limits = {}
+        self._running_by_source = {}
+        self._pending_by_source = {}
+        self._unfinished = 0
+        self._running = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0,
+                       "queue_latency_total": 0.0, "queue_latency_max": 0.0,
+                       "run_time_total": 0.0, "run_time_max": 0.0}
+        self._branch_pools = {}
+        self._shutdown = False
+        self._started = False
+        self.resize(max_workers or config.max_workers)
+
+    def resize(self, max_workers):
+        with self._lock:
+            difference = max_workers - self._worker_count
+            self._worker_count = max_workers
+            if not self._started:
+                return
+            for _ in range(difference):
+                threading.Thread(target=self._work, daemon=True, name='osintflow_concurrent_').start()
+        # surplus workers exit when they pick up one of these
+        for _ in range(-difference):
+            self._queue.put(None)
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self._worker_count):
+                threading.Thread(target=self._work, daemon=True, name='osintflow_concurrent_').start()
+
+    def set_limit(self, source, max_running):
+        with self._lock:
+            if max_running is None:
+                self._limits.pop(source, None)
+            else:
+                self._limits[source] = max_running
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        return self.submit_task(func, args, kwargs)
+
+    def submit_task(self, func, args=(), kwargs=None, source=None, callback=None, timeout=None) -> Future:
+        # blocks while the queue is full; raises queue.Full if that lasts longer than timeout
+        if self._shutdown:
+            raise RuntimeError("cannot submit after shutdown")
+        if not self._started:
+            self._start()
+        if not self._slots.acquire(timeout=timeout):
+            raise queue.Full
+        task = _Task(func, args, kwargs or {}, source, callback)
+        with self._lock:
+            self._unfinished += 1
+            self._stats['submitted'] += 1
+        self._queue.put(task)
+        return task.future
+
+    def _acquire(self, task) -> bool:
+        # with the lock held: either take a slot for the task's source or park it until a slot frees up
+        limit = self._limits.get(task.source)
+        running = self._running_by_source.get(task.source, 0)
+        if limit is not None and running >= limit:
+            self._pending_by_source.setdefault(task.source, deque()).append(task)
+            return False
+        self._running_by_source[task.source] = running + 1
+        self._running += 1
+        self._slots.release()
+        return True
+
+    def _release(self, task):
+        # with the lock held: hand the freed slot straight to a parked task of the same source, if any
+        pending = self._pending_by_source.get(task.source)
+        if pending:
+            self._slots.release()
+            return pending.popleft()
+        self._running_by_source[task.source] -= 1
+        self._running -= 1
+        return None
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            with self._lock:
+                if not self._acquire(task):
+                    continue
+            while task is not None:
+                self._run(task)
+                with self._lock:
+                    task = self._release(task)
+
+    def _run(self, task):
+        started = time.perf_counter()
+        failed = False
+        if task.future.set_running_or_notify_cancel():
+            try:
+                result = task.func(*task.args, **task.kwargs)
+                if task.callback is not None:
+                    task.callback(result)
+                task.future.set_result(result)
+            except Exception as e:
+                failed = True
+                traceback.print_exc()
+                task.future.set_exception(e)
+        finished = time.perf_counter()
+        with self._lock:
+            self._stats['failed' if failed else 'completed'] += 1
+            self._stats['queue_latency_total'] += started - task.submitted
+            self._stats['queue_latency_max'] = max(self._stats['queue_latency_max'], started - task.submitted)
+            self._stats['run_time_total'] += finished - started
+            self._stats['run_time_max'] = max(self._stats['run_time_max'], finished - started)
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._drained.notify_all()
+
+    def _wait(self, timeout=None) -> bool:
+        # blocks until everything submitted so far has finished; the pool stays usable afterwards
+        with self._lock:
+            return self._drained.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def _wait_at_exit(self):
+        # a hung task must not keep the interpreter from exiting
+        if not self._wait(config.exit_wait_timeout):
+            print(f"WARNING: exiting with {self._unfinished} osint.thread tasks unfinished "
+                  f"after {config.exit_wait_timeout}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self._stats['completed'] + self._stats['failed']
+            return {
+                "workers": self._worker_count,
+                "queue_depth": self._queue.qsize() + sum(map(len, self._pending_by_source.values())),
+                "running": self._running,
+                "running_by_source": {source: running for source, running in self._running_by_source.items()
+                                      if running},
+                "submitted": self._stats['submitted'],
+                "completed": self._stats['completed'],
+                "failed": self._stats['failed'],
+                "queue_latency_avg": self._stats['queue_latency_total'] / done if done else 0.0,
+                "queue_latency_max": self._stats['queue_latency_max'],
+                "run_time_avg": self._stats['run_time_total'] / done if done else 0.0,
+                "run_time_max": self._stats['run_time_max'],
+            }
 
-    def _wait(self):
-        self.pool.shutdown()
+    def shutdown(self, wait=True):
+        if wait:
+            self._wait()
+        self._shutdown = True
+        self.resize(0)
+        for pool in self._branch_pools.values():
+            pool.shutdown(wait=wait)
 
-    def thread(self, callback=None):
+    def branch_pool(self, executor=None, max_workers=None):
+        # pools for dataflow branches are kept apart from the job workers so a job running inside
+        # osint.thread can never wait on branches queued behind itself
+        if executor is None or isinstance(executor, Executor):
+            return executor
+        key = (executor, max_workers or config.max_workers)
+        with self._lock:
+            pool = self._branch_pools.get(key)
+            if pool is None:
+                if executor == 'thread':
+                    pool = ThreadPoolExecutor(max_workers=key[1], thread_name_prefix='osintflow_branch_')
+                elif executor == 'process':
+                    pool = ProcessPoolExecutor(max_workers=key[1])
+                else:
+                    raise ValueError(f"Unknown executor: {executor}")
+                self._branch_pools[key] = pool
+            return pool
+
+    def process(self, callback=None, max_workers=None):
+        # the decorated function must be importable (module level); the worker process resolves it by name
+        # and calls the undecorated original, since the module attribute is this wrapper itself
         def wrapper(func):
+            if '<locals>' in func.__qualname__:
+                raise ValueError(f"osint.process needs a module level function, {func.__qualname__} is local "
+                                 f"to another function and cannot be sent to a worker process")
+
+            @functools.wraps(func)
             def inner_wrapper(*args, **kwargs):
-                def task():
-                    try:
-                        data = func(*args, **kwargs)
-                        if callback is not None:
-                            callback(data)
-                    except Exception as e:
-                        traceback.print_exc()
+                pool = self.branch_pool('process', max_workers)
+                future = pool.submit(_call_by_name, func.__module__, func.__qualname__, args, kwargs)
+                if callback is not None:
+                    future.add_done_callback(functools.partial(_run_callback, callback))
+                return future
+
+            return inner_wrapper
 
-                return self.pool.submit(task)
+        return wrapper
+
+    def parallel_map(self, func, records, backend='process', chunk_size=None, max_workers=None):
+        # maps func over records in chunks so each IPC round trip carries chunk_size records; results keep
+        # the input order and only a bounded window of chunks is in flight, so records may be a lazy stream
+        pool = self.branch_pool(backend, max_workers)
+        window = (max_workers or config.max_workers) * 2
+        chunks = util.chunked(records, chunk_size or config.process_chunk_size)
+        in_flight = deque(pool.submit(_map_chunk, func, chunk) for chunk in islice(chunks, window))
+        while in_flight:
+            results = in_flight.popleft().result()
+            for chunk in islice(chunks, 1):
+                in_flight.append(pool.submit(_map_chunk, func, chunk))
+            yield from results
+
+    def thread(self, callback=None, source=None):
+        def wrapper(func):
+            def inner_wrapper(*args, **kwargs):
+                return self.submit_task(func, args, kwargs, source=source, callback=callback)
 
             return inner_wrapper
 
         return wrapper
 
 
+def _call_by_name(module, qualname, args, kwargs):
+    target = importlib.import_module(module)
+    for name in qualname.split('.'):
+        target = getattr(target, name)
+    return getattr(target, '__wrapped__', target)(*args, **kwargs)
+
+
+def _map_chunk(func, chunk):
+    return [func(record) for record in chunk]
+
+
+def _run_callback(callback, future):
+    try:
+        callback(future.result())
+    except Exception:
+        traceback.print_exc()
+
+
 _concurrent = _Concurrent()
 wait = _concurrent._wait
+atexit.register(_concurrent._wait_at_exit)
@@ -6,3 +6,33 @@ headers = {
     'Accept-Encoding': 'gzip, deflate',
 }
 max_workers = 10
+mongo_max_pool_size = 100
+mongo_min_pool_size = 0
+mysql_pool_size = 5
+mysql_max_overflow = 10
+mysql_pool_recycle = 3600
+mongo_chunk_size = 5000
+stream_chunk_size = 64 * 1024
+charset_sample_size = 64 * 1024
+charset_cache_size = 1024
+fetch_limit_per_host = 4
+fetch_max_workers = 32
+response_cache_size = 1024
+template_cache_size = 1024
+http_pool_connections = 10
+http_pool_maxsize = 10
+max_queue_size = 1000
+exit_wait_timeout = 60
+process_chunk_size = 1000
+minio_part_size = 8 * 1024 * 1024
+minio_buffer_chunks = 64
+page_prefetch = 4
+page_retries = 3
+page_backoff = 0.5
+page_retry_statuses = (429, 500, 502, 503, 504)
+write_behind_flush_size = 1000
+write_behind_flush_interval = 1.0
+write_behind_queue_size = 50000
+write_behind_flush_timeout = 60
+write_behind_retry_max = 30
+ioc_found_size = 1000000
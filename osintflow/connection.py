@@ -0,0 +1,112 @@
+import atexit
+import threading
+
+import osintflow.config as config
+import osintflow.util as util
+
+# client libraries are imported when the first client of their kind is created
+minio = util.lazy_import('minio')
+pymongo = util.lazy_import('pymongo')
+sqlalchemy = util.lazy_import('sqlalchemy')
+
+
+class _ConnectionRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mongo_clients = {}
+        self._mysql_engines = {}
+        self._minio_clients = {}
+        self._stats = {
+            "mongo_created": 0,
+            "mongo_reused": 0,
+            "mysql_created": 0,
+            "mysql_reused": 0,
+            "minio_created": 0,
+            "minio_reused": 0,
+            "closed": 0,
+        }
+
+    def mongo_client(self, configure):
+        key = (configure['mongodb_uri'],
+               configure.get('mongodb_max_pool_size', config.mongo_max_pool_size),
+               configure.get('mongodb_min_pool_size', config.mongo_min_pool_size))
+        with self._lock:
+            client = self._mongo_clients.get(key)
+            if client is not None:
+                self._stats['mongo_reused'] += 1
+                return client
+            client = pymongo.MongoClient(key[0], maxPoolSize=key[1], minPoolSize=key[2])
+            self._mongo_clients[key] = client
+            self._stats['mongo_created'] += 1
+            return client
+
+    def mysql_engine(self, configure):
+        # mysql_url (any SQLAlchemy URL, e.g. sqlite:// for local runs) takes precedence over the mysql_* fields
+        db_url = configure.get('mysql_url') or "mysql://{}:{}@{}:{}/{}".format(
+            configure['mysql_user'],
+            configure['mysql_password'],
+            configure['mysql_host'],
+            configure['mysql_port'],
+            configure['mysql_database']
+        )
+        key = (db_url,
+               configure.get('mysql_pool_size', config.mysql_pool_size),
+               configure.get('mysql_max_overflow', config.mysql_max_overflow))
+        with self._lock:
+            engine = self._mysql_engines.get(key)
+            if engine is not None:
+                self._stats['mysql_reused'] += 1
+                return engine
+            if db_url.startswith('sqlite'):
+                engine = sqlalchemy.create_engine(db_url)
+            else:
+                engine = sqlalchemy.create_engine(db_url, pool_size=key[1], max_overflow=key[2],
+                                                  pool_recycle=config.mysql_pool_recycle, pool_pre_ping=True)
+            self._mysql_engines[key] = engine
+            self._stats['mysql_created'] += 1
+            return engine
+
+    def minio_client(self, configure):
+        key = (configure['minio_endpoint'], configure['minio_access_key'], configure['minio_secure'])
+        with self._lock:
+            client = self._minio_clients.get(key)
+            if client is not None:
+                self._stats['minio_reused'] += 1
+                return client
+            client = minio.Minio(
+                configure['minio_endpoint'],
+                access_key=configure['minio_access_key'],
+                secret_key=configure['minio_secret_key'],
+                secure=configure['minio_secure']
+            )
+            self._minio_clients[key] = client
+            self._stats['minio_created'] += 1
+            return client
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['mongo_open'] = len(self._mongo_clients)
+            stats['mysql_open'] = len(self._mysql_engines)
+            stats['minio_open'] = len(self._minio_clients)
+            return stats
+
+    def close(self):
+        with self._lock:
+            for client in self._mongo_clients.values():
+                client.close()
+            for engine in self._mysql_engines.values():
+                engine.dispose()
+            self._stats['closed'] += len(self._mongo_clients) + len(self._mysql_engines)
+            self._mongo_clients.clear()
+            self._mysql_engines.clear()
+            self._minio_clients.clear()
+
+
+_registry = _ConnectionRegistry()
+mongo_client = _registry.mongo_client
+mysql_engine = _registry.mysql_engine
+minio_client = _registry.minio_client
+stats = _registry.stats
+close = _registry.close
+atexit.register(close)
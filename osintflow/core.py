@@ -1,117 +1,444 @@
+import contextvars
+import functools
+import json
+import threading
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from pangres import upsert, UnnamedIndexLevelsException
-import pandas as pd
-from sqlalchemy import create_engine
-import requests
 import yaml
-from minio import Minio
-from pymongo import MongoClient
-import chardet
-from pymongo.errors import InvalidOperation
-from pymongo.results import BulkWriteResult
 
+import osintflow.cache as response_caches
 import osintflow.config as config
+import osintflow.connection as connection
+import osintflow.metrics as metrics
+import osintflow.schedule as schedule
+import osintflow.stream as osint_stream
 import osintflow.util as util
 from osintflow.concurrent import _concurrent
-from osintflow.mongo import ops as mongo_ops
+from osintflow.dedupe import Deduplicator
+
+# backends are imported on first use, a job only pays for the libraries it actually touches
+pd = util.lazy_import('pandas')
+pangres = util.lazy_import('pangres')
+requests = util.lazy_import('requests')
+pymongo_errors = util.lazy_import('pymongo.errors')
+osint_encoding = util.lazy_import('osintflow.encoding')
+osint_fetch = util.lazy_import('osintflow.fetch')
+minio_ops = util.lazy_import('osintflow.minio.ops')
+mongo_ops = util.lazy_import('osintflow.mongo.ops')
+mongo_writebehind = util.lazy_import('osintflow.mongo.writebehind')
+mysql_ops = util.lazy_import('osintflow.mysql.ops')
+
+
+# the job whose decorated function is running in this thread / context, for handlers that need to reach it
+_running_job = contextvars.ContextVar('osintflow_running_job', default=None)
+
+
+def current_job():
+    return _running_job.get()
+
+
+class _JobContext:
+    # everything one invocation of a decorated job reads or writes; cookies and the session carry over to the
+    # next invocation in the same thread / context, but never to jobs running concurrently elsewhere
+    def __init__(self, previous=None, cookies=None):
+        self.data = None
+        self.cookies = previous.cookies if previous is not None else cookies
+        self.session = previous.session if previous is not None else None
+        self.stored_mongo_log = None
+        self.stored_mysql_log = None
+        self.stored_minio_log = None
+        self.raw = None
+        self.raw_chunks = None
+        self.dropped_duplicates = 0
+        self.encoding_report = None
+        self.unchanged = False
+        self.branch_timings = []
+        self.write_behinds = []
+        self.commit_hooks = []
+        self.source_checkpoint = None
+        self.active = False
+
+
+def _context_attribute(name):
+    def getter(self):
+        return self._current().__dict__[name]
+
+    def setter(self, value):
+        self._current().__dict__[name] = value
+
+    return property(getter, setter)
 
 
 class OsintflowJob:
+    data = _context_attribute('data')
+    stored_mongo_log = _context_attribute('stored_mongo_log')
+    stored_mysql_log = _context_attribute('stored_mysql_log')
+    stored_minio_log = _context_attribute('stored_minio_log')
+    raw = _context_attribute('raw')
+    dropped_duplicates = _context_attribute('dropped_duplicates')
+    encoding_report = _context_attribute('encoding_report')
+    unchanged = _context_attribute('unchanged')
+    branch_timings = _context_attribute('branch_timings')
+    _cookies = _context_attribute('cookies')
+
     def __init__(self):
-        self.data = None
-        self._cookies = None
-        self.stored_mongo_log: BulkWriteResult = None
-        self._session = requests.Session()
+        self._context = contextvars.ContextVar(f'osintflow_job_{id(self)}')
+        self._default_cookies = None
+        self._lock = threading.Lock()
+        self._fetchers = {}
+        self._adapter = None
+
+    def _current(self) -> _JobContext:
+        context = self._context.get(None)
+        if context is None:
+            context = _JobContext(cookies=self._default_cookies)
+            self._context.set(context)
+        return context
+
+    @contextmanager
+    def _run(self, name=None):
+        # the outermost decorator of a call opens a fresh context, the decorators nested inside it share it
+        previous = self._context.get(None)
+        if previous is not None and previous.active:
+            yield previous
+            return
+        context = _JobContext(previous, self._default_cookies)
+        context.active = True
+        self._context.set(context)
+        job_token = _running_job.set(self)
+        recorder, token = metrics.start(name)
+        succeeded = False
+        try:
+            yield context
+            succeeded = True
+        finally:
+            context.active = False
+            # a job is only done once the records it handed to write-behind buffers are written
+            flushed = self._flush_write_behinds(context)
+            metrics.finish(recorder, token)
+            _running_job.reset(job_token)
+        if succeeded and flushed:
+            for hook in context.commit_hooks:
+                hook()
+
+    def on_commit(self, hook) -> bool:
+        # hook() runs once the current job has finished without an error and its stores (write-behind buffers
+        # included) are written; False when called outside a job, the hook is then not registered
+        context = self._context.get(None)
+        if context is None or not context.active:
+            return False
+        context.commit_hooks.append(hook)
+        return True
+
+    def _in_run(self, inner_wrapper):
+        @functools.wraps(inner_wrapper)
+        def run_wrapper(*args, **kwargs):
+            with self._run(inner_wrapper.__name__):
+                return inner_wrapper(*args, **kwargs)
+
+        return run_wrapper
+
+    def _new_session(self):
+        # one connection pool shared by the per-invocation sessions
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = requests.adapters.HTTPAdapter(pool_connections=config.http_pool_connections,
+                                                              pool_maxsize=config.http_pool_maxsize)
+        session = requests.Session()
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        return session
+
+    @property
+    def _session(self):
+        context = self._current()
+        if context.session is None:
+            context.session = self._new_session()
+        return context.session
+
+    @_session.setter
+    def _session(self, session):
+        self._current().session = session
 
     def register(self, func):
         exec(f'self.{func.__name__} = func', globals(), locals())
 
     def source_web(self, url, data=None, method='get', mode='t', coding='utf-8', consumes=None, inherit_cookies=False,
-                   new_session=False, auth=None, headers=None, cookie=None, proxies=None, params=None):
+                   new_session=False, auth=None, headers=None, cookie=None, proxies=None, params=None,
+                   stream=None, items=None, chunk_size=None, cache=None):
+        # stream: None keeps the eager mode (self.data is the whole body); 'bytes', 'text' or 'lines' make
+        # self.data an iterator of raw chunks / decoded chunks / lines, and 'json' yields the items of the
+        # top-level array (or of the array under the top-level key `items`, e.g. items='objects') one by one
+        # cache: a directory (or ResponseCache); sends If-None-Match / If-Modified-Since and, when the body is
+        # unchanged since the last successful run, skips dataflow and the store decorators (store_log still logs)
         if cookie is not None:
-            self._cookies = cookie
+            self._default_cookies = cookie
         if headers is None:
             headers = {}
+        response_cache = response_caches.get(cache) if isinstance(cache, str) else cache
+        render = util.compile_params([url, coding, data])
 
         def wrapper(func):
             def inner_wrapper(*args, **kwargs):
-                global response
                 if new_session:
-                    self._session = requests.Session()
-                _url, _coding, _data = self._replace_all_params(kwargs, url, coding, data)
+                    self._session = self._new_session()
+                _url, _coding, _data = render(kwargs, globals())
                 headers.update(config.headers)
                 if consumes is not None:
                     headers['Content-Type'] = consumes
-                if method.lower() == 'post':
-                    response = self._session.post(_url, headers=headers, data=_data,
-                                                  cookies=self._cookies if inherit_cookies else None,
-                                                  auth=auth, proxies=proxies)
-                elif method.lower() == 'get':
-                    response = self._session.get(
-                        _url + (f'?{"&".join([k + "=" + _data[k] for k in _data])}' if _data is not None else ''),
-                        headers=config.headers if headers is None else headers,
-                        cookies=self._cookies if inherit_cookies else None, auth=auth, proxies=proxies, params=params)
+                request_headers = headers
+                if response_cache is not None:
+                    cache_key = response_cache.key(method, _url, _data, params)
+                    request_headers = dict(headers, **response_cache.conditional_headers(cache_key))
+                with metrics.stage('source_web.fetch') as stage:
+                    if method.lower() == 'post':
+                        response = self._session.post(_url, headers=request_headers, data=_data,
+                                                      cookies=self._cookies if inherit_cookies else None,
+                                                      auth=auth, proxies=proxies, stream=stream is not None)
+                    elif method.lower() == 'get':
+                        response = self._session.get(
+                            _url + (f'?{"&".join([k + "=" + _data[k] for k in _data])}' if _data is not None else ''),
+                            headers=request_headers,
+                            cookies=self._cookies if inherit_cookies else None, auth=auth, proxies=proxies,
+                            params=params, stream=stream is not None)
+                    # a streamed body is counted as it is read, see below
+                    stage.add(bytes_in=0 if stream is not None else len(response.content),
+                              retries=_retries(response))
                 if not inherit_cookies:
                     self._cookies = response.cookies
-                self.data = response.content
-                if mode == 't':
-                    try:
-                        encoding = chardet.detect(self.data)['encoding']
-                        if encoding is not None:
-                            encoding = str(encoding)
-                            self.data = self.data.decode(encoding)
-                    except UnicodeDecodeError as e:
-                        print(e)
+
+                self.unchanged = False
+                content_hash = None
+                if response_cache is not None:
+                    if stream is None:
+                        content_hash = response_cache.content_hash(response.content)
+                    if response_cache.is_unchanged(cache_key, response, content_hash):
+                        response.close()
+                        self.unchanged = True
+                        self.data = None
+                        result = func(*args, **kwargs)
+                        response_cache.update(cache_key, response, content_hash)
+                        return result
+
+                if stream is not None:
+                    encoding = osint_encoding.header_charset(response.headers.get('Content-Type')) or _coding
+                    byte_chunks = osint_stream.CountingIterator(
+                        response.iter_content(chunk_size=chunk_size or config.stream_chunk_size), len)
+                    # store_minio(source='raw') archives the body from here while it is read
+                    self._current().raw_chunks = osint_stream.Tee(byte_chunks)
+                    self.data = metrics.timed_iter(
+                        'source_web.stream',
+                        osint_stream.iter_response(response, stream, encoding, items,
+                                                   byte_chunks=self._current().raw_chunks),
+                        lambda recorder: recorder.add('source_web.fetch', bytes_in=byte_chunks.bytes))
+                else:
+                    self.data = self.raw = response.content
+                    if mode == 't':
+                        with metrics.stage('source_web.decode') as stage:
+                            text, self.encoding_report = osint_encoding.decode(
+                                self.data, response.headers.get('Content-Type'), _url)
+                            stage.add(bytes_in=len(self.data), bytes_out=len(text) if text is not None else 0)
+                        if text is not None:
+                            self.data = text
+                        else:
+                            print(f"WARNING: could not decode response from {_url}")
+                result = func(*args, **kwargs)
+                if response_cache is not None:
+                    response_cache.update(cache_key, response, content_hash)
+                return result
+
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
+
+        return wrapper
+
+    def source_web_many(self, url, param_sets=None, data=None, method='get', mode='t', coding='utf-8', consumes=None,
+                        auth=None, headers=None, cookie=None, proxies=None, params=None, limit_per_host=None):
+        # url may be a list; each url is rendered once per dict of <param> values in param_sets (a list, or a
+        # callable taking the call kwargs), all requests run concurrently and self.data is the list of bodies
+        # in the same order
+        if headers is None:
+            headers = {}
+        renders = [util.compile_params([template, coding, data]) for template in (url if type(url) == list else [url])]
+
+        def wrapper(func):
+            def inner_wrapper(*args, **kwargs):
+                _headers = dict(headers)
+                _headers.update(config.headers)
+                if consumes is not None:
+                    _headers['Content-Type'] = consumes
+                sets = param_sets(**kwargs) if callable(param_sets) else param_sets
+                targets = []
+                for render in renders:
+                    for param_set in (sets if sets is not None else [{}]):
+                        targets.append(render({**kwargs, **param_set}, globals()))
+                responses = self._fetcher(limit_per_host).run(
+                    [self._request_kwargs(method, _url, _data, _headers, cookie, auth, proxies, params)
+                     for _url, _coding, _data in targets])
+
+                self.data = []
+                self.encoding_report = []
+                for response, (_url, _coding, _data) in zip(responses, targets):
+                    body = response.content
+                    if mode == 't':
+                        text, report = osint_encoding.decode(body, response.headers.get('Content-Type'), _url)
+                        self.encoding_report.append(report)
+                        if text is not None:
+                            body = text
+                        else:
+                            print(f"WARNING: could not decode response from {_url}")
+                    self.data.append(body)
+                return func(*args, **kwargs)
+
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
+
+        return wrapper
+
+    def source_web_paged(self, url, strategy, items=None, data=None, method='get', coding='utf-8', consumes=None,
+                         auth=None, headers=None, cookie=None, proxies=None, params=None, prefetch=None, rate=None,
+                         burst=None, retries=None, backoff=None, limit_per_host=None):
+        # strategy: fetch.OffsetPages / PageNumberPages / CursorPages / DateWindowPages. Every page is parsed as
+        # JSON and self.data streams the records of all pages in page order: page[items] (or items(page)), or the
+        # page itself when items is None. Up to `prefetch` pages are requested ahead, each host is held to `rate`
+        # requests per second (token bucket, `burst` at once) and transient failures are retried with backoff
+        if headers is None:
+            headers = {}
+        render = util.compile_params([url, coding, data])
+        retry_options = dict(retries=retries, backoff=backoff, rate=rate, burst=burst)
+
+        def parse(response):
+            text, report = osint_encoding.decode(response.content, response.headers.get('Content-Type'),
+                                                 response.url)
+            if text is None:
+                raise ValueError(f"could not decode response from {response.url}")
+            page = json.loads(text)
+            if callable(items):
+                records = items(page)
+            elif items is not None:
+                records = page.get(items) or []
+            else:
+                records = page if type(page) == list else [page]
+            return page, records
+
+        def iter_records(fetcher, request):
+            for page, records in fetcher.iter_pages(request, strategy, parse, prefetch, **retry_options):
+                yield from records
+
+        def wrapper(func):
+            def inner_wrapper(*args, **kwargs):
+                _headers = dict(headers)
+                _headers.update(config.headers)
+                if consumes is not None:
+                    _headers['Content-Type'] = consumes
+                _url, _coding, _data = render(kwargs, globals())
+                request = self._request_kwargs(method, _url, _data, _headers, cookie, auth, proxies, params)
+                self.data = iter_records(self._fetcher(limit_per_host), request)
                 return func(*args, **kwargs)
 
             inner_wrapper.__name__ = func.__name__
-            return inner_wrapper
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
-    def source_mongo(self, configure, query):
+    def _fetcher(self, limit_per_host=None):
+        limit_per_host = limit_per_host or config.fetch_limit_per_host
+        with self._lock:
+            if limit_per_host not in self._fetchers:
+                self._fetchers[limit_per_host] = osint_fetch.AsyncFetcher(limit_per_host)
+            return self._fetchers[limit_per_host]
+
+    @staticmethod
+    def _request_kwargs(method, _url, _data, headers, cookies, auth, proxies, params):
+        if method.lower() == 'post':
+            return dict(method='POST', url=_url, headers=headers, data=_data, cookies=cookies, auth=auth,
+                        proxies=proxies)
+        return dict(method='GET',
+                    url=_url + (f'?{"&".join([k + "=" + _data[k] for k in _data])}' if _data is not None else ''),
+                    headers=headers, cookies=cookies, auth=auth, proxies=proxies, params=params)
+
+    def source_mongo(self, configure, query, projection=None, batch_size=None, checkpoint=None, tail=False):
+        # batch_size / checkpoint / tail switch to a lazy source: documents are read in _id order, batch_size at
+        # a time, and the stores downstream consume them as a stream. checkpoint is a file path keeping the last
+        # _id (and the change stream resume token) so an interrupted run continues where it stopped; tail keeps
+        # following inserts / updates through a change stream after the scan (replica set only)
         if isinstance(configure, str):
             with open(configure, 'r') as f:
                 configure = yaml.load(f, Loader=yaml.FullLoader)
+        stream = batch_size is not None or checkpoint is not None or tail
 
         def wrapper(func):
             def inner_wrapper(*args, **kwargs):
-                self.data = self._get_data_from_mongo(configure, query)
+                if not stream:
+                    self.data = self._get_data_from_mongo(configure, query, projection)
+                    return func(*args, **kwargs)
+
+                collection = mongo_ops.get_collection(configure, 'mongodb_source_database',
+                                                      'mongodb_source_collection')
+                _checkpoint = mongo_ops.Checkpoint(checkpoint) if checkpoint is not None else None
+                self.data = mongo_ops.iter_documents(collection, query, projection, batch_size, _checkpoint, tail)
+                if _checkpoint is not None:
+                    # a store writing this stream directly commits the position as its writes go through;
+                    # the end of the stream is only saved once the job and its write-behind flushes succeeded
+                    self._current().source_checkpoint = _checkpoint
+                    self.on_commit(_checkpoint.save)
                 return func(*args, **kwargs)
 
-            return inner_wrapper
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
-    def _get_data_from_mongo(self, configure: dict, query: dict) -> list:
-        with MongoClient(configure['mongodb_uri']) as client:
-            try:
-                db = client[configure['mongodb_source_database']]
-                return list(db[configure['mongodb_source_collection']].find(query))
+    def _get_data_from_mongo(self, configure: dict, query: dict, projection=None) -> list:
+        try:
+            collection = mongo_ops.get_collection(configure, 'mongodb_source_database', 'mongodb_source_collection')
+            return list(collection.find(query, projection))
 
-            except Exception as e:
-                print("ERROR: " + datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"), e)
+        except Exception as e:
+            print("ERROR: " + datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"), e)
 
-    def dataflow(self, *handlers):
+    def dataflow(self, *handlers, executor=None, max_workers=None):
+        # executor: None evaluates the branches of list / dict handlers one after another; 'thread', 'process'
+        # (branch handlers must then be picklable, i.e. module-level functions) or any concurrent.futures.Executor
+        # evaluates them in parallel, keeping result order and keys, with per-branch times in self.branch_timings
         def wrapper(func):
             def inner_wrapper(*args, **kwargs):
-                self.data = self._handle(self.data, *handlers, **kwargs)
+                if not self.unchanged:
+                    self.branch_timings = []
+                    with metrics.stage('dataflow') as stage:
+                        stage.add(records_in=_record_count(self.data))
+                        self.data = self._handle(self.data, *handlers,
+                                                 _pool=_concurrent.branch_pool(executor, max_workers), **kwargs)
+                        if not all(osint_stream.is_pull_through(handler) for handler in handlers):
+                            # records may be read ahead of what reaches the store, whose writes then no longer
+                            # tell how far the source is done; its checkpoint waits for the end of the job
+                            self._current().source_checkpoint = None
+                        stage.add(records_out=_record_count(self.data))
                 return func(*args, **kwargs)
 
             inner_wrapper.__name__ = func.__name__
-            return inner_wrapper
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
-    def _handle(self, data, *handlers, **kwargs):
+    def _handle(self, data, *handlers, _pool=None, **kwargs):
         for handler in handlers:
             if type(handler) == list:
+                if _pool is not None:
+                    data = self._handle_branches(data, list(enumerate(handler)), _pool)
+                    continue
                 result = []
                 for single in handler:
                     result.append(self._handle(data, single))
                 data = result
             elif type(handler) == dict:
+                if _pool is not None:
+                    keys = [self._replace_all_params(kwargs, self._handle(data, key))[0] for key in handler]
+                    data = dict(zip(keys, self._handle_branches(data, list(zip(keys, handler.values())), _pool)))
+                    continue
                 result = {}
                 for key in handler:
                     single = handler[key]
@@ -120,50 +447,68 @@ class OsintflowJob:
                         data, single)
                 data = result
             elif callable(handler):
-                data = handler(data)
+                with metrics.stage('dataflow.' + getattr(handler, '__name__', type(handler).__name__)):
+                    data = handler(data)
             else:
                 return handler
         return data
 
+    def _handle_branches(self, data, branches, pool):
+        # branches run on this instance; a process worker cannot receive it and builds one of the same class
+        job = type(self) if isinstance(pool, ProcessPoolExecutor) else self
+        if job is self:
+            # threads see the job context (on_commit, metrics) of the branches' caller
+            futures = [pool.submit(contextvars.copy_context().run, _handle_branch, data, single, job)
+                       for key, single in branches]
+        else:
+            futures = [pool.submit(_handle_branch, data, single, job) for key, single in branches]
+        result = []
+        for (key, single), future in zip(branches, futures):
+            branch_result, elapsed = future.result()
+            self.branch_timings.append({"branch": key, "elapsed": elapsed})
+            result.append(branch_result)
+        return result
+
     def _replace_param(self, s, **kwargs):
-        if type(s) == str:
-            return util.parse_template(s, kwargs, globals(), locals())
-        elif type(s) == list:
-            result = []
-            for item in s:
-                result.append(self._replace_param(item, **kwargs))
-            return result
-        elif type(s) == dict:
-            result = {}
-            for key in s:
-                result[self._replace_param(key, **kwargs)] = self._replace_param(s[key], **kwargs)
-            return result
+        return util.compile_params(s)(kwargs, globals())
 
     def _replace_all_params(self, to_repl, *args):
-        new_args = []
-        for arg in args:
-            new_args.append(self._replace_param(arg, **to_repl))
-        return new_args
+        return util.compile_params(list(args))(to_repl, globals())
 
-    def store_mongo(self, configure):
+    def store_mongo(self, configure, write_behind=None):
+        # write_behind (or mongodb_write_behind in the config): records are queued to a background writer and the
+        # job goes on while they are written; they are flushed at the latest when the job ends
         if isinstance(configure, str):
             with open(configure, 'r') as f:
                 configure = yaml.load(f, Loader=yaml.FullLoader)
+        if write_behind is None:
+            write_behind = configure.get('mongodb_write_behind', False)
 
         def wrapper(func):
             def inner_wrapper(*args, **kwargs):
+                if self.unchanged:
+                    return func(*args, **kwargs)
+
                 # Call the original function
                 if self.data is None:
                     raise ValueError("No data to store")
 
-                self.stored_mongo_log = self._store_mongo(configure, self.data)
+                if osint_stream.is_stream(self.data):
+                    self.data = osint_stream.CountingIterator(self.data)
+                with metrics.stage('store_mongo') as stage:
+                    if write_behind:
+                        self.stored_mongo_log = self._store_mongo_write_behind(configure, self.data)
+                    else:
+                        self.stored_mongo_log = self._store_mongo(configure, self.data)
+                    stage.add(records_in=_record_count(self.data))
 
                 # Return the original function's result
                 data = func(*args, **kwargs)
                 self.data = data
                 return data
 
-            return inner_wrapper
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
@@ -173,36 +518,74 @@ class OsintflowJob:
                     compare_field=None,
                     if_row_exists="update",
                     table_name=None,
-                    append=False):
+                    append=False,
+                    batch_size=5000,
+                    bulk=False):
+        # bulk: skip pandas/pangres and stream rows as executemany multi-row INSERT ... ON DUPLICATE KEY UPDATE
+        # (plain INSERT when append) over a pooled connection; throughput goes to store_log
         if isinstance(configure, str):
             with open(configure, 'r') as f:
                 configure = yaml.load(f, Loader=yaml.FullLoader)
 
         def wrapper(func):
             def inner_wrapper(*args, **kwargs):
+                if self.unchanged:
+                    return func(*args, **kwargs)
+
                 # Call the original function
                 if self.data is None:
                     raise ValueError("No data to store")
 
-                if not append:
-                    self.__upsert_mysql(configure,
-                                        self.data,
-                                        dtype=dtype,  # same logic as the parameter in pandas.to_sql
-                                        compare_field=compare_field,
-                                        if_row_exists=if_row_exists,
-                                        table_name=table_name)
+                if osint_stream.is_stream(self.data):
+                    # streamed records are written batch by batch as they are produced
+                    self.data = osint_stream.CountingIterator(self.data)
+
+                if bulk:
+                    if not append and compare_field is None:
+                        raise ValueError("You should put compare column name to upsert on table")
+                    rows = self.data
+                    # DataFrames are converted without importing pandas here; the bulk path never needs it
+                    if hasattr(rows, 'to_dict'):
+                        rows = rows.to_dict('records')
+                    elif type(rows) == dict:
+                        rows = [rows]
+                    with metrics.stage('store_mysql') as stage:
+                        self.stored_mysql_log = mysql_ops.bulk_load(
+                            rows, connection.mysql_engine(configure), table_name or configure['mysql_table'],
+                            compare_field=None if append else compare_field, if_row_exists=if_row_exists,
+                            batch_size=batch_size)
+                        stage.add(records_in=self.stored_mysql_log['rows'])
+                    data = func(*args, **kwargs)
+                    self.data = data
+                    return data
+
+                if osint_stream.is_stream(self.data):
+                    batches = util.chunked(self.data, batch_size)
+                elif append:
+                    batches = (self.data[i:i + batch_size] for i in range(0, len(self.data), batch_size))
                 else:
-                    batch_size = 5000
-                    for i in range(0, len(self.data), batch_size):
-                        batch = self.data[i:i+batch_size]
-                        self.__append_mysql(configure, batch, table_name)
+                    batches = [self.data]
+
+                with metrics.stage('store_mysql') as stage:
+                    for batch in batches:
+                        stage.add(records_in=_record_count(batch))
+                        if not append:
+                            self.__upsert_mysql(configure,
+                                                batch,
+                                                dtype=dtype,  # same logic as the parameter in pandas.to_sql
+                                                compare_field=compare_field,
+                                                if_row_exists=if_row_exists,
+                                                table_name=table_name)
+                        else:
+                            self.__append_mysql(configure, batch, table_name)
 
                 # Return the original function's result
                 data = func(*args, **kwargs)
                 self.data = data
                 return data
 
-            return inner_wrapper
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
@@ -216,13 +599,15 @@ class OsintflowJob:
             def inner_wrapper(*args, **kwargs):
                 # Call the original function
                 data = func(*args, **kwargs)
-                if data is None:
+                if data is None and not self.unchanged:
                     raise ValueError("No data to store")
 
+                # counts of write-behind stores are only complete once their records are written
+                self._flush_write_behinds(self._current())
                 upserted_count = 0
                 try:
                     upserted_count = self.stored_mongo_log.upserted_count if self.stored_mongo_log is not None else 0
-                except InvalidOperation as e:
+                except pymongo_errors.InvalidOperation as e:
                     print(e)
 
                 log = {"_id": params['_id'] if '_id' in params else str(uuid.uuid4()),
@@ -234,61 +619,134 @@ class OsintflowJob:
                        "log": {
                            "message": params['message'] if 'message' in params else "",
                            "stats": {
-                               "crawl_counts": len(self.data) if self.data is not None else 0,
-                               "upsert_counts": upserted_count
+                               "crawl_counts": osint_stream.count(self.data),
+                               "upsert_counts": upserted_count,
+                               "duplicate_counts": self.dropped_duplicates,
+                               "encoding": self.encoding_report,
+                               "no_op": self.unchanged
                            },
                            "execution_end_time":
                                params['execution_end_time_callable']()
                                if "execution_end_time_callable" in params else datetime.utcnow()
                        }}
 
+                if self.stored_mysql_log is not None:
+                    log['log']['stats']['mysql'] = self.stored_mysql_log
+                if self.stored_minio_log is not None:
+                    log['log']['stats']['minio'] = self.stored_minio_log
+                if self._current().write_behinds:
+                    log['log']['stats']['write_behind'] = {writer.name: writer.stats()
+                                                           for writer in self._current().write_behinds}
+                recorder = metrics.recorder()
+                if recorder is not None:
+                    log['log']['stats']['stages'] = recorder.report()['stages']
+
                 if "execution_start_time" in params:
                     log['log']['execution_start_time'] = params['execution_start_time']
 
-                self._store_mongo(configure, log, logging=True)
+                if configure.get('mongodb_write_behind', False):
+                    self._store_mongo_write_behind(configure, log, logging=True)
+                else:
+                    self._store_mongo(configure, log, logging=True)
                 return data
 
-            return inner_wrapper
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
 
         return wrapper
 
     def _store_mongo(self, configure, data, logging=None, **kwargs):
+        if osint_stream.is_stream(data):
+            return self._store_mongo_chunked(configure, mongo_ops.get_collection(configure), data)
+
         if len(data) == 0:
             print("WARNING: no data")
             return
 
-        with MongoClient(configure['mongodb_uri']) as client:
-            db = client[configure['mongodb_database']]
-            collection = db[configure['mongodb_collection']]
+        collection = mongo_ops.get_collection(configure)
 
-            if logging:
-                collection.insert_one(data)
-                return
+        if logging:
+            collection.insert_one(data)
+            return
 
-            if type(data) == dict and data:
-                return mongo_ops.upsert_or_revoke([data], collection,
-                                                  configure['mongodb_compare_field'])
+        if type(data) == dict and data:
+            return mongo_ops.upsert_or_revoke([data], collection,
+                                              configure['mongodb_compare_field'],
+                                              configure.get('mongodb_fingerprint_field'))
 
-            elif type(data) == list and data:
-                unique_dicts = [i for n, i in enumerate(data) if i not in data[n + 1:]]
-                return mongo_ops.upsert_or_revoke(unique_dicts, collection,
-                                                  configure['mongodb_compare_field'])
-            else:
-                raise ValueError("Invalid data to store: make sure data is not empty dict or empty list")
+        elif type(data) == list and data and 'mongodb_chunk_size' in configure:
+            return self._store_mongo_chunked(configure, collection, data)
+
+        elif type(data) == list and data:
+            with metrics.stage('store_mongo.dedupe') as stage:
+                deduplicator = Deduplicator(configure.get('mongodb_dedupe_key'))
+                unique_dicts = deduplicator(data)
+                stage.add(records_in=len(data), records_out=len(unique_dicts))
+            self.dropped_duplicates = deduplicator.dropped
+            return mongo_ops.upsert_or_revoke(unique_dicts, collection,
+                                              configure['mongodb_compare_field'],
+                                              configure.get('mongodb_fingerprint_field'))
+        else:
+            raise ValueError("Invalid data to store: make sure data is not empty dict or empty list")
+
+    def _store_mongo_chunked(self, configure, collection, data):
+        deduplicator = Deduplicator(configure.get('mongodb_dedupe_key'))
+        summary = mongo_ops.upsert_or_revoke_chunked(deduplicator.dedupe(data), collection,
+                                                     configure['mongodb_compare_field'],
+                                                     configure.get('mongodb_fingerprint_field'),
+                                                     configure.get('mongodb_chunk_size'),
+                                                     self._source_checkpoint(data))
+        self.dropped_duplicates = deduplicator.dropped
+        return summary
+
+    def _store_mongo_write_behind(self, configure, data, logging=False):
+        if not osint_stream.is_stream(data) and len(data) == 0:
+            print("WARNING: no data")
+            return
+        writer = mongo_writebehind.get(configure, None if logging else configure['mongodb_compare_field'], logging)
+        context = self._current()
+        if writer not in context.write_behinds:
+            context.write_behinds.append(writer)
+        if type(data) == dict:
+            data = [data]
+        summary = mongo_ops.UpsertSummary()
+        checkpoint = None if logging else self._source_checkpoint(data)
+        deduplicator = None
+        if not logging:
+            deduplicator = Deduplicator(configure.get('mongodb_dedupe_key'))
+            data = deduplicator.dedupe(data)
+        for batch in util.chunked(data, writer.flush_size):
+            on_written = functools.partial(checkpoint.commit, checkpoint.mark()) if checkpoint is not None else None
+            # copies: the writer prepares documents on its own thread while later ones are still deduplicated
+            writer.put([dict(document) for document in batch], summary, on_written=on_written)
+        if deduplicator is not None:
+            self.dropped_duplicates = deduplicator.dropped
+        return summary
+
+    def _source_checkpoint(self, data):
+        # only a stream pulled straight from source_mongo (through per-record stages) tells how far it is written
+        if not osint_stream.is_stream(data):
+            return None
+        return self._current().source_checkpoint
+
+    def _flush_write_behinds(self, context) -> bool:
+        flushed = True
+        for writer in context.write_behinds:
+            if not writer.flush(config.write_behind_flush_timeout):
+                flushed = False
+                print(f"WARNING: write-behind for {writer.collection.full_name} not flushed within "
+                      f"{config.write_behind_flush_timeout}s, queue depth {writer.stats()['queue_depth']}")
+        return flushed
+
+    def write_behind_stats(self) -> dict:
+        return mongo_writebehind.stats()
 
     def __append_mysql(self, configure, data, table_name=None):
         if len(data) == 0:
             print("WARNING: no data")
             return
 
-        db_url = "mysql://{}:{}@{}:{}/{}".format(
-            configure['mysql_user'],
-            configure['mysql_password'],
-            configure['mysql_host'],
-            configure['mysql_port'],
-            configure['mysql_database']
-        )
-        engine = create_engine(db_url)
+        engine = connection.mysql_engine(configure)
 
         df: pd.DataFrame
         if type(data) == dict and data:
@@ -318,14 +776,7 @@ class OsintflowJob:
             print("WARNING: no data")
             return
 
-        db_url = "mysql://{}:{}@{}:{}/{}".format(
-            configure['mysql_user'],
-            configure['mysql_password'],
-            configure['mysql_host'],
-            configure['mysql_port'],
-            configure['mysql_database']
-        )
-        engine = create_engine(db_url)
+        engine = connection.mysql_engine(configure)
 
         df: pd.DataFrame
         if type(data) == pd.DataFrame:
@@ -345,7 +796,7 @@ class OsintflowJob:
             df.set_index(compare_field, inplace=True)
             df.index.set_names([compare_field], inplace=True)
         try:
-            upsert(
+            pangres.upsert(
                 con=engine,
                 df=df,
                 table_name=configure['mysql_table'] if not table_name else table_name,
@@ -354,25 +805,112 @@ class OsintflowJob:
                 chunksize=1000,
                 create_table=True  # create a new table if it does not exist
             )
-        except UnnamedIndexLevelsException as e:
+        except pangres.UnnamedIndexLevelsException as e:
             raise ValueError("You should put compare column name to upsert on table")
 
-    def _store_minio(self, configure, data):
-        # TODO: need to check GDP storing convention
-        client = Minio(
-            configure['minio_endpoint'],
-            access_key=configure['minio_access_key'],
-            secret_key=configure['minio_secret_key'],
-            secure=configure['minio_secure']
-        )
-        client.put_object(
-            bucket_name=configure['minio_bucket'],
-            object_name=data.get('filename', 'data.bin'),
-            data=data,
-            length=len(data),
-        )
+    def store_minio(self, configure, source='raw', compression=None, prefix=None):
+        # source='raw' archives the body source_web downloaded, 'records' archives self.data as JSON lines;
+        # objects are named by the sha256 of the payload so identical payloads are uploaded only once, and
+        # streamed bodies and records are archived while they pass through to the decorators below
+        if isinstance(configure, str):
+            with open(configure, 'r') as f:
+                configure = yaml.load(f, Loader=yaml.FullLoader)
+        if prefix is None:
+            prefix = configure.get('minio_prefix', '')
+
+        def wrapper(func):
+            def inner_wrapper(*args, **kwargs):
+                if self.unchanged:
+                    return func(*args, **kwargs)
+
+                if self.data is None:
+                    raise ValueError("No data to store")
+
+                writer = None
+                if source == 'records' and osint_stream.is_stream(self.data):
+                    writer = minio_ops.records_writer(connection.minio_client(configure), configure['minio_bucket'],
+                                                      prefix, compression)
+                    rest = self.data = minio_ops.tee_records(writer, self.data)
+                elif source == 'raw' and self.raw is None and self._current().raw_chunks is not None:
+                    rest = self._current().raw_chunks
+                    if rest.started:
+                        raise ValueError("Nothing to archive: the streamed raw body was read before store_minio")
+                    writer = minio_ops.ObjectWriter(connection.minio_client(configure), configure['minio_bucket'],
+                                                    prefix, compression)
+                    rest.sinks.append(writer.write)
+                if writer is not None:
+                    try:
+                        data = func(*args, **kwargs)
+                        # whatever the decorators below left unread is archived too
+                        for _ in rest:
+                            pass
+                    except BaseException:
+                        writer.abort()
+                        raise
+                    self.stored_minio_log = writer.close()
+                    self.data = data
+                    return data
+
+                self.stored_minio_log = self._store_minio(configure, self.raw if source == 'raw' else self.data,
+                                                          compression, prefix)
+                data = func(*args, **kwargs)
+                self.data = data
+                return data
+
+            inner_wrapper.__name__ = func.__name__
+            return self._in_run(inner_wrapper)
+
+        return wrapper
+
+    def _store_minio(self, configure, data, compression=None, prefix=''):
+        if data is None:
+            raise ValueError("Nothing to archive: no raw body was downloaded by source_web")
+        client = connection.minio_client(configure)
+        if type(data) == str:
+            data = data.encode('utf-8')
+        if type(data) == bytes:
+            return minio_ops.put_bytes(client, configure['minio_bucket'], data, prefix, compression)
+        if type(data) == dict:
+            data = [data]
+        return minio_ops.put_records(client, configure['minio_bucket'], data, prefix, compression)
+
+
+def _record_count(data) -> int:
+    # a single dict is one record, not len() keys; a raw body is not counted as records at all
+    if type(data) == dict:
+        return 1
+    if isinstance(data, (str, bytes)):
+        return 0
+    return osint_stream.count(data)
+
+
+def _retries(response) -> int:
+    # retries urllib3 made under the adapter's max_retries before this response
+    retries = getattr(response.raw, 'retries', None)
+    return len(retries.history) if retries is not None else 0
+
+
+def _handle_branch(data, handler, job):
+    # module-level so it can be shipped to a process pool; the branch itself is evaluated sequentially.
+    # job is the scheduling OsintflowJob, or its class when it had to cross a process boundary
+    start = time.perf_counter()
+    if isinstance(job, type):
+        job = job()
+    result = job._handle(data, handler)
+    return result, time.perf_counter() - start
 
 
 osint = OsintflowJob()
 osint.thread = _concurrent.thread
+osint.process = _concurrent.process
+osint.parallel_map = _concurrent.parallel_map
 osint.wait = _concurrent._wait
+osint.resize = _concurrent.resize
+osint.set_limit = _concurrent.set_limit
+osint.scheduler_stats = _concurrent.stats
+osint.every = schedule.every
+osint.cron = schedule.cron
+osint.close = connection.close
+osint.connection_stats = connection.stats
+osint.enable_metrics = metrics.enable
+osint.disable_metrics = metrics.disable
@@ -0,0 +1,44 @@
+import osintflow.util as util
+
+
+class Deduplicator:
+    # usable as an osint.dataflow handler; `dropped` is the number of duplicates removed by the last call.
+    # A list keeps the last of its duplicates, in the order of those last occurrences, like the list dedupe
+    # _store_mongo used before; iter() streams and can only keep the first
+
+    def __init__(self, key=None):
+        if isinstance(key, str):
+            key = (key,)
+        self.key = tuple(key) if key else None
+        self.dropped = 0
+
+    def fingerprint(self, document):
+        return util.content_hash(document, self.key)
+
+    def iter(self, documents):
+        # first occurrence wins: a later duplicate is not known yet when a document is passed on
+        self.dropped = 0
+        seen = set()
+        for document in documents:
+            fingerprint = self.fingerprint(document)
+            if fingerprint in seen:
+                self.dropped += 1
+                continue
+            seen.add(fingerprint)
+            yield document
+
+    def __call__(self, data):
+        if type(data) == dict:
+            self.dropped = 0
+            return data
+        unique = list(self.iter(reversed(list(data))))
+        unique.reverse()
+        return unique
+
+    def dedupe(self, data):
+        # last-wins list for a list, first-wins stream for anything else
+        return self(data) if type(data) == list else self.iter(data)
+
+
+def dedupe(documents, key=None):
+    return Deduplicator(key)(documents)
@@ -0,0 +1,111 @@
+import codecs
+import threading
+import time
+from collections import OrderedDict
+
+import osintflow.config as config
+import osintflow.util as util
+
+# only needed when BOM, header and utf-8 all fail
+chardet = util.lazy_import('chardet')
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+class _DetectedEncodingCache:
+    def __init__(self, max_size):
+        self._lock = threading.Lock()
+        self._encodings = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, url):
+        with self._lock:
+            encoding = self._encodings.get(url)
+            if encoding is not None:
+                self._encodings.move_to_end(url)
+            return encoding
+
+    def put(self, url, encoding):
+        with self._lock:
+            self._encodings[url] = encoding
+            self._encodings.move_to_end(url)
+            while len(self._encodings) > self._max_size:
+                self._encodings.popitem(last=False)
+
+
+_detected = _DetectedEncodingCache(config.charset_cache_size)
+
+
+def header_charset(content_type):
+    if not content_type:
+        return None
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset' and value:
+            charset = value.strip().strip('"\'')
+            try:
+                return codecs.lookup(charset).name
+            except LookupError:
+                return None
+    return None
+
+
+def bom_encoding(content: bytes):
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return encoding
+    return None
+
+
+def _try_decode(content: bytes, encoding):
+    try:
+        return content.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+def decode(content: bytes, content_type=None, url=None, sample_size=None):
+    # cheapest strategy first; chardet only ever sees a bounded sample and its answer is cached per url
+    start = time.perf_counter()
+
+    def report(text, encoding, strategy):
+        return text, {"encoding": encoding, "strategy": strategy, "elapsed": time.perf_counter() - start}
+
+    # a BOM overrides the header charset, as in browsers; decoding it as the header's utf-8 would keep '\ufeff'
+    encoding = bom_encoding(content)
+    if encoding is not None:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return report(text, encoding, 'bom')
+
+    encoding = header_charset(content_type)
+    if encoding is not None:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return report(text, encoding, 'header')
+
+    text = _try_decode(content, 'utf-8')
+    if text is not None:
+        return report(text, 'utf-8', 'utf-8')
+
+    encoding = _detected.get(url) if url is not None else None
+    if encoding is not None:
+        text = _try_decode(content, encoding)
+        if text is not None:
+            return report(text, encoding, 'cache')
+
+    encoding = chardet.detect(content[:sample_size or config.charset_sample_size])['encoding']
+    if encoding is not None:
+        encoding = str(encoding)
+        text = _try_decode(content, encoding)
+        if text is not None:
+            if url is not None:
+                _detected.put(url, encoding)
+            return report(text, encoding, 'detect')
+    return report(None, encoding, 'failed')
@@ -0,0 +1,291 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import osintflow.config as config
+import osintflow.metrics as metrics
+
+
+class AsyncFetcher:
+    # requests stays the HTTP client; asyncio schedules the calls on a thread pool, a semaphore per host caps
+    # concurrent requests to it and one keep-alive session per host is reused across calls. The host slots
+    # belong to the fetcher, so the limit holds across concurrent calls too, and the shared sessions never
+    # store cookies: a job's Set-Cookie responses must not reach another job's requests
+    def __init__(self, limit_per_host=None, max_workers=None):
+        self.limit_per_host = limit_per_host or config.fetch_limit_per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or config.fetch_max_workers,
+                                            thread_name_prefix='osintflow_fetch_')
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._host_slots = {}
+
+    def session(self, url) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.limit_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _host_slot(self, url) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.limit_per_host)
+            return slot
+
+    def _request(self, request: dict) -> requests.Response:
+        with self._host_slot(request['url']):
+            return self.session(request['url']).request(**request)
+
+    async def fetch(self, request: dict, semaphores: dict) -> requests.Response:
+        host = urlsplit(request['url']).netloc
+        semaphore = semaphores.setdefault(host, asyncio.Semaphore(self.limit_per_host))
+        async with semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._request, request)
+
+    async def fetch_all(self, requests_) -> list:
+        # request dicts are keyword arguments of requests.Session.request; responses keep the input order
+        semaphores = {}
+        return await asyncio.gather(*[self.fetch(request, semaphores) for request in requests_])
+
+    def run(self, requests_) -> list:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.fetch_all(requests_))
+        # called from inside an event loop (e.g. a notebook): asyncio.run is not allowed there, so the requests
+        # go to the thread pool directly; the host slots still apply
+        return [future.result() for future in [self._executor.submit(self._request, request)
+                                               for request in requests_]]
+
+    def request_with_retry(self, request: dict, retries=None, backoff=None, rate=None, burst=None,
+                           stage=None) -> requests.Response:
+        # retries connection errors, timeouts and the statuses in config.page_retry_statuses with exponential
+        # backoff (plus jitter, or the server's numeric Retry-After); every attempt takes a token from the host's
+        # bucket when rate is set. stage, created on the calling thread, receives the retry count
+        retries = config.page_retries if retries is None else retries
+        backoff = config.page_backoff if backoff is None else backoff
+        host = urlsplit(request['url']).netloc
+        stage = stage or metrics.stage('source_web_paged.fetch')
+        with stage:
+            for attempt in range(retries + 1):
+                if rate is not None:
+                    rate_limiter.acquire(host, rate, burst)
+                delay = backoff * 2 ** attempt * (1 + random.random())
+                try:
+                    response = self._request(request)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == retries:
+                        raise
+                else:
+                    if response.status_code not in config.page_retry_statuses or attempt == retries:
+                        response.raise_for_status()
+                        stage.add(bytes_in=len(response.content))
+                        return response
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        delay = float(retry_after)
+                    response.close()
+                stage.add(retries=1)
+                time.sleep(delay)
+
+    def iter_pages(self, request: dict, strategy, parse, prefetch=None, **retry_options):
+        # yields (page, records) in page order. Pages of strategies with independent requests (offset, date
+        # windows) are fetched up to `prefetch` ahead of the consumer; cursor pages depend on the previous
+        # response and are fetched one at a time
+        prefetch = prefetch or config.page_prefetch
+        in_flight = deque()
+        index = 0
+        previous = None
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < (prefetch if strategy.independent else 1):
+                    page_request = strategy.request(request, index, previous)
+                    if page_request is None:
+                        exhausted = True
+                        break
+                    in_flight.append(self._executor.submit(self.request_with_retry, page_request,
+                                                           stage=metrics.stage('source_web_paged.fetch'),
+                                                           **retry_options))
+                    index += 1
+                if not in_flight:
+                    return
+                page, records = parse(in_flight.popleft().result())
+                previous = page
+                yield page, records
+                if strategy.is_last(page, records):
+                    return
+        finally:
+            # pages prefetched past the last one are dropped
+            for future in in_flight:
+                future.cancel()
+
+    def close(self):
+        self._executor.shutdown()
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+def _with_params(request: dict, values: dict, page_in='params') -> dict:
+    # page_in: 'params' (query string), 'json' or 'data' (request body)
+    request = dict(request)
+    request[page_in] = dict(request.get(page_in) or {}, **values)
+    return request
+
+
+class OffsetPages:
+    # offset / limit pagination; the last page is the first one with fewer than `limit` records
+    independent = True
+
+    def __init__(self, limit=100, start=0, offset_param='offset', limit_param='limit', max_pages=None,
+                 page_in='params'):
+        self.limit = limit
+        self.start = start
+        self.offset_param = offset_param
+        self.limit_param = limit_param
+        self.max_pages = max_pages
+        self.page_in = page_in
+
+    def request(self, request, index, previous):
+        if self.max_pages is not None and index >= self.max_pages:
+            return None
+        return _with_params(request, {self.offset_param: self.start + index * self.limit,
+                                      self.limit_param: self.limit}, self.page_in)
+
+    def is_last(self, page, records):
+        return len(records) < self.limit
+
+
+class PageNumberPages(OffsetPages):
+    # page=1, 2, ... with a fixed page size
+    def __init__(self, size=100, start=1, page_param='page', size_param=None, max_pages=None, page_in='params'):
+        super().__init__(size, start, page_param, size_param, max_pages, page_in)
+
+    def request(self, request, index, previous):
+        if self.max_pages is not None and index >= self.max_pages:
+            return None
+        values = {self.offset_param: self.start + index}
+        if self.limit_param is not None:
+            values[self.limit_param] = self.limit
+        return _with_params(request, values, self.page_in)
+
+
+class CursorPages:
+    # the next request comes from the previous page: `cursor` is a key of the parsed page or a callable
+    # returning the next cursor (or a full next url); pages end when it is empty
+    independent = False
+
+    def __init__(self, cursor='next', cursor_param='cursor', start=None, max_pages=None, page_in='params'):
+        self.cursor = cursor
+        self.cursor_param = cursor_param
+        self.start = start
+        self.max_pages = max_pages
+        self.page_in = page_in
+
+    def next_cursor(self, page):
+        if callable(self.cursor):
+            return self.cursor(page)
+        return page.get(self.cursor) if isinstance(page, dict) else None
+
+    def request(self, request, index, previous):
+        if self.max_pages is not None and index >= self.max_pages:
+            return None
+        if index == 0:
+            cursor = self.start
+        else:
+            cursor = self.next_cursor(previous)
+            if not cursor:
+                return None
+        if cursor is None:
+            return dict(request)
+        if isinstance(cursor, str) and cursor.startswith(('http://', 'https://')):
+            return dict(request, url=cursor)
+        return _with_params(request, {self.cursor_param: cursor}, self.page_in)
+
+    def is_last(self, page, records):
+        return not self.next_cursor(page)
+
+
+class DateWindowPages:
+    # consecutive [since, until) windows of `step` from start up to end (default: now), formatted with `format`
+    independent = True
+
+    def __init__(self, start, end=None, step=timedelta(days=1), since_param='from', until_param='to',
+                 format='%Y-%m-%d', page_in='params'):
+        self.start = start
+        self.end = end
+        self.step = step
+        self.since_param = since_param
+        self.until_param = until_param
+        self.format = format
+        self.page_in = page_in
+
+    def request(self, request, index, previous):
+        end = self.end or datetime.utcnow()
+        since = self.start + index * self.step
+        if since >= end:
+            return None
+        until = min(since + self.step, end)
+        return _with_params(request, {self.since_param: since.strftime(self.format),
+                                      self.until_param: until.strftime(self.format)}, self.page_in)
+
+    def is_last(self, page, records):
+        return False
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # blocks until a token is available
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _RateLimiter:
+    # one token bucket per host for the whole process, so concurrent jobs hitting a host share its budget
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def acquire(self, host, rate, burst=None):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None or bucket.rate != rate or bucket.burst != (burst or max(1.0, rate)):
+                bucket = self._buckets[host] = TokenBucket(rate, burst)
+        bucket.acquire()
+
+
+rate_limiter = _RateLimiter()
@@ -0,0 +1,217 @@
+import functools
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+
+import osintflow.config as config
+import osintflow.stream as osint_stream
+
+# one alternation, scanned once per text; earlier alternatives win, so a url is not split into its host and
+# path, and a 64 character hash is not read as a 32 character one. Every IOC starts a word, and the leading
+# guard lets the scan skip all other positions without trying the alternatives (about twice as fast)
+_OCTET = r"(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9]|0[0-9]{1,2})"
+_IOC_PATTERN = re.compile(
+    r"(?<!\w)(?=\w)(?:"
+    r"(?P<url>\b(?:https?|ftp)://[^\s\"'<>`]+)"
+    r"|(?P<ipv4>(?<![0-9.])" + _OCTET + r"(?:\." + _OCTET + r"){3}(?![0-9]|\.[0-9]))"
+    r"|(?P<hash>\b(?:[0-9a-fA-F]{64}|[0-9a-fA-F]{40}|[0-9a-fA-F]{32})\b)"
+    r"|(?P<domain>\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z][a-zA-Z0-9-]{1,62}\b"
+    r"(?![.-]?[a-zA-Z0-9])))"
+)
+_HASH_TYPES = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+_REFANG = [('[.]', '.'), ('(.)', '.'), ('{.}', '.'), ('[dot]', '.'), ('(dot)', '.'), ('[:]', ':'),
+           ('[://]', '://'), ('hxxp', 'http'), ('hXXp', 'http'), ('fxp://', 'ftp://')]
+_URL_TRAILING = '.,;:!?)]}\'"'
+# names that look like domains but are file names in text feeds
+NOT_TLDS = frozenset(["exe", "dll", "sys", "bin", "bat", "cmd", "ps1", "vbs", "js", "jar", "py", "sh", "php", "asp",
+                      "aspx", "jsp", "html", "htm", "css", "xml", "json", "txt", "log", "csv", "pdf", "doc", "docx",
+                      "xls", "xlsx", "ppt", "pptx", "rtf", "zip", "rar", "gz", "tgz", "7z", "tar", "iso", "img",
+                      "png", "jpg", "jpeg", "gif", "svg", "ico", "bmp", "mp3", "mp4", "tmp", "dat", "lnk", "msi",
+                      "cfg", "ini", "conf", "yaml", "yml", "md", "so", "elf", "apk", "dmg"])
+TYPES = ('url', 'ipv4', 'domain', 'md5', 'sha1', 'sha256')
+
+
+def refang(text: str) -> str:
+    for defanged, plain in _REFANG:
+        if defanged in text:
+            text = text.replace(defanged, plain)
+    return text
+
+
+def _normalize(kind: str, value: str):
+    # returns (type, value), or None for matches that are not IOCs
+    if kind == 'url':
+        value = value.rstrip(_URL_TRAILING)
+        scheme, _, rest = value.partition('://')
+        host, slash, path = rest.partition('/')
+        return 'url', f"{scheme.lower()}://{host.lower()}{slash}{path}"
+    if kind == 'ipv4':
+        return 'ipv4', '.'.join(str(int(octet)) for octet in value.split('.'))
+    if kind == 'hash':
+        return _HASH_TYPES[len(value)], value.lower()
+    value = value.lower()
+    if value.rsplit('.', 1)[1] in NOT_TLDS:
+        return None
+    return 'domain', value
+
+
+def iter_iocs(text: str, types=None, defanged=True):
+    # yields (type, normalized value) for every IOC in text, in order, duplicates included
+    if defanged:
+        text = refang(text)
+    for match in _IOC_PATTERN.finditer(text):
+        ioc = _normalize(match.lastgroup, match.group())
+        if ioc is not None and (types is None or ioc[0] in types):
+            yield ioc
+
+
+def _iter_chunk_texts(chunks):
+    # re-cuts consecutive chunks of one text at whitespace, so no IOC is split between two scans
+    pending = ''
+    for chunk in chunks:
+        text = pending + chunk
+        cut = max(text.rfind(' '), text.rfind('\n'), text.rfind('\t'))
+        if cut < 0:
+            pending = text
+            continue
+        pending = text[cut:]
+        yield text[:cut]
+    if pending:
+        yield pending
+
+
+class BloomFilter:
+    # memory-compact seen-set (capacity items at error_rate false positives); membership can be wrong in the
+    # "already seen" direction only. With a path the bits are loaded from and saved to that file
+    _HEADER = struct.Struct('<4sQQQ')
+    _MAGIC = b'OFBF'
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001):
+        self.path = path
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                magic, self.size, self.hashes, self.count = self._HEADER.unpack(f.read(self._HEADER.size))
+                if magic != self._MAGIC:
+                    raise ValueError(f"{path} is not a bloom filter file")
+                self._bits = bytearray(f.read())
+            return
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        # double hashing: k positions from the two halves of one 128 bit digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack('<QQ', digest)
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def add(self, value: str) -> bool:
+        # True when value was not in the set yet
+        positions = self._positions(value)
+        with self._lock:
+            bits = self._bits
+            new = False
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not bits[position >> 3] & mask:
+                    bits[position >> 3] |= mask
+                    new = True
+            if new:
+                self.count += 1
+            return new
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(self._HEADER.pack(self._MAGIC, self.size, self.hashes, self.count))
+                f.write(self._bits)
+        os.replace(tmp_path, path)
+
+
+class ExtractIOCs:
+    # dataflow handler: takes a text payload (str / bytes), or records -- strings, or dicts with the text under
+    # text_field (a key or a callable) -- and returns {"type", "value"} records, one per distinct IOC.
+    # chunked=True reads a stream of strings as consecutive chunks of one text (source_web stream='text').
+    # With seen (e.g. a BloomFilter), IOCs already in it are dropped. New IOCs only go into it once they are
+    # stored, through an on_commit hook that runs after the job succeeded: the running job's, or the given
+    # on_commit(hook), which must return True once it took the hook. A seen-set with a path is saved on every
+    # commit
+    def __init__(self, types=None, seen=None, text_field=None, chunked=False, defanged=True, on_commit=None):
+        self.types = frozenset(types) if types is not None else None
+        self.seen = seen
+        self.text_field = text_field
+        self.chunked = chunked
+        self.defanged = defanged
+        self.on_commit = on_commit
+
+    def _texts(self, data):
+        if isinstance(data, (str, bytes, dict)):
+            data = [data]
+        if self.chunked:
+            yield from _iter_chunk_texts(data)
+            return
+        for record in data:
+            if isinstance(record, dict):
+                record = self.text_field(record) if callable(self.text_field) else record.get(self.text_field)
+            if isinstance(record, bytes):
+                record = record.decode('utf-8', errors='replace')
+            if record:
+                yield record
+
+    def _extract(self, data, pending=None):
+        # with a seen-set the IOCs pending commit are the per-call dedupe set, since they have to be kept until
+        # the commit anyway; without one, the set only dedupes within config.ioc_found_size distinct IOCs
+        found = set()
+        seen = self.seen
+        for text in self._texts(data):
+            for ioc in iter_iocs(text, self.types, self.defanged):
+                if seen is not None:
+                    key = f"{ioc[0]}:{ioc[1]}"
+                    if key in pending or key in seen:
+                        continue
+                    pending.add(key)
+                else:
+                    if ioc in found:
+                        continue
+                    if len(found) >= config.ioc_found_size:
+                        found.clear()
+                    found.add(ioc)
+                yield {"type": ioc[0], "value": ioc[1]}
+
+    def __call__(self, data):
+        pending = None
+        if self.seen is not None:
+            pending = set()
+            on_commit = self.on_commit
+            if on_commit is None:
+                from osintflow.core import current_job  # deferred, core is only needed once a seen-set is used
+                job = current_job()
+                if job is None:
+                    raise ValueError("ExtractIOCs with a seen-set runs inside a job, or needs on_commit")
+                on_commit = job.on_commit
+            if not on_commit(functools.partial(self._commit, pending)):
+                raise ValueError("ExtractIOCs could not register its seen-set commit, the job is not running")
+        records = self._extract(data, pending)
+        if osint_stream.is_stream(data):
+            return records
+        return list(records)
+
+    def _commit(self, pending):
+        for key in pending:
+            self.seen.add(key)
+        if getattr(self.seen, 'path', None) is not None:
+            self.seen.save()
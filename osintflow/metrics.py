@@ -0,0 +1,201 @@
+import contextvars
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+_FIELDS = ('calls', 'seconds', 'records_in', 'records_out', 'bytes_in', 'bytes_out', 'retries')
+
+
+class Stage:
+    # one timed section; counters are added up into the recorder when the section exits
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self.name = name
+        self.records_in = 0
+        self.records_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self._started = None
+
+    def add(self, records_in=0, records_out=0, bytes_in=0, bytes_out=0, retries=0):
+        self.records_in += records_in
+        self.records_out += records_out
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.retries += retries
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._recorder.add(self.name, calls=1, seconds=time.perf_counter() - self._started,
+                           records_in=self.records_in, records_out=self.records_out,
+                           bytes_in=self.bytes_in, bytes_out=self.bytes_out, retries=self.retries)
+        return False
+
+
+class _NullStage:
+    # handed out while instrumentation is off, so instrumented code pays for one ContextVar lookup only
+    def add(self, records_in=0, records_out=0, bytes_in=0, bytes_out=0, retries=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Recorder:
+    # per-invocation totals keyed by stage name, in the order the stages were first seen
+    def __init__(self, job):
+        self.job = job
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = OrderedDict()
+        self._closed = False
+
+    def stage(self, name) -> Stage:
+        return Stage(self, name)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+    def add(self, name, **counters):
+        # samples arriving after the job finished (a stream consumed late) are dropped; the report is already out
+        with self._lock:
+            if self._closed:
+                return
+            totals = self._stages.get(name)
+            if totals is None:
+                totals = self._stages[name] = dict.fromkeys(_FIELDS, 0)
+            for field, value in counters.items():
+                totals[field] += value
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"job": self.job, "seconds": time.perf_counter() - self.started,
+                    "stages": {name: dict(totals) for name, totals in self._stages.items()}}
+
+
+class _Metrics:
+    def __init__(self):
+        self._current = contextvars.ContextVar('osintflow_metrics', default=None)
+        self._exporters = []
+        self.enabled = False
+
+    def enable(self, *exporters):
+        # exporters are called with Recorder.report() after every job invocation
+        self._exporters.extend(exporters)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self._exporters = []
+
+    def start(self, job):
+        # returns (recorder, token) for finish(); (None, None) while disabled
+        if not self.enabled:
+            return None, None
+        recorder = Recorder(job)
+        return recorder, self._current.set(recorder)
+
+    def finish(self, recorder, token):
+        if recorder is None:
+            return
+        self._current.reset(token)
+        recorder.close()
+        report = recorder.report()
+        for exporter in list(self._exporters):
+            try:
+                exporter(report)
+            except Exception:
+                traceback.print_exc()
+
+    def recorder(self):
+        return self._current.get()
+
+    def stage(self, name):
+        recorder = self._current.get()
+        if recorder is None:
+            return _NULL_STAGE
+        return recorder.stage(name)
+
+    def timed_iter(self, name, iterable, on_finish=None):
+        # for lazy sources: the stage accumulates the time spent producing each record; time spent by the
+        # consumer between two records is not counted. on_finish(recorder) adds what is only known at the end
+        recorder = self._current.get()
+        if recorder is None:
+            return iterable
+        return _timed_iter(recorder, name, iterable, on_finish)
+
+
+def _timed_iter(recorder, name, iterable, on_finish=None):
+    iterator = iter(iterable)
+    records = 0
+    seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                record = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - started
+            records += 1
+            yield record
+    finally:
+        recorder.add(name, calls=1, seconds=seconds, records_out=records)
+        if on_finish is not None:
+            on_finish(recorder)
+
+
+class PrometheusTextfile:
+    # exporter for the node_exporter textfile collector; keeps the latest report of every job and rewrites
+    # the whole file atomically, so several jobs of one process can share it
+    def __init__(self, path, prefix='osintflow'):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._reports = OrderedDict()
+
+    def __call__(self, report):
+        with self._lock:
+            self._reports[report['job']] = report
+            lines = []
+            for field in _FIELDS:
+                metric = f"{self.prefix}_stage_{field}"
+                lines.append(f"# TYPE {metric} gauge")
+                for job, job_report in self._reports.items():
+                    for stage, totals in job_report['stages'].items():
+                        lines.append(f'{metric}{{job="{_escape(job)}",stage="{_escape(stage)}"}} {totals[field]}')
+            lines.append(f"# TYPE {self.prefix}_job_seconds gauge")
+            for job, job_report in self._reports.items():
+                lines.append(f'{self.prefix}_job_seconds{{job="{_escape(job)}"}} {job_report["seconds"]}')
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_metrics = _Metrics()
+enable = _metrics.enable
+start = _metrics.start
+finish = _metrics.finish
+disable = _metrics.disable
+stage = _metrics.stage
+timed_iter = _metrics.timed_iter
+recorder = _metrics.recorder
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import queue
+import threading
+import uuid
+import zlib
+
+from minio import Minio
+from minio.commonconfig import ComposeSource
+from minio.error import S3Error
+
+import osintflow.config as config
+
+_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+class _Compressor:
+    def __init__(self, compression=None):
+        if compression not in _EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == 'gzip':
+            self._compressor = zlib.compressobj(wbits=31)
+        elif compression == 'zstd':
+            import zstandard  # optional, only needed for zstd archives
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self._compressor = None
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) if self._compressor is not None else chunk
+
+    def flush(self) -> bytes:
+        return self._compressor.flush() if self._compressor is not None else b''
+
+
+class _PipeReader:
+    # file-like object put_object reads from while the producer is still writing; the queue bounds the
+    # bytes waiting between them. The buffer is a bytearray: appending and dropping consumed bytes from its
+    # front do not copy what is left, so filling a part stays linear in its size
+    def __init__(self, max_chunks):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._closed = False
+
+    def write(self, chunk: bytes):
+        if chunk:
+            self._queue.put(chunk)
+
+    def close(self):
+        self._queue.put(None)
+
+    def read(self, size=-1) -> bytes:
+        while not self._closed and (size < 0 or len(self._buffer) < size):
+            chunk = self._queue.get()
+            if chunk is None:
+                self._closed = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class ObjectWriter:
+    # streams bytes into a multipart upload under a temporary name; on close the object is renamed to the
+    # content hash of the uncompressed payload, or dropped if an object with that hash already exists
+    def __init__(self, client: Minio, bucket, prefix='', compression=None, content_type='application/octet-stream',
+                 extension='', part_size=None):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.extension = extension + _EXTENSIONS[compression]
+        self.size = 0
+        self.compressed_size = 0
+        self._hash = hashlib.sha256()
+        self._compressor = _Compressor(compression)
+        self._temporary_name = f"{prefix}.upload/{uuid.uuid4()}"
+        self._pipe = _PipeReader(config.minio_buffer_chunks)
+        self._error = None
+        self._uploader = threading.Thread(target=self._upload, args=(content_type, part_size or config.minio_part_size),
+                                          daemon=True, name='osintflow_minio_upload')
+        self._uploader.start()
+
+    def _upload(self, content_type, part_size):
+        try:
+            self.client.put_object(self.bucket, self._temporary_name, self._pipe, length=-1,
+                                   content_type=content_type, part_size=part_size, num_parallel_uploads=1)
+        except Exception as e:
+            self._error = e
+            # keep draining so the producer never blocks on a dead upload
+            while self._pipe.read(config.minio_part_size):
+                pass
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        compressed = self._compressor.compress(chunk)
+        self.compressed_size += len(compressed)
+        self._pipe.write(compressed)
+
+    def abort(self):
+        self._pipe.close()
+        self._uploader.join()
+        if self._error is None:
+            self.client.remove_object(self.bucket, self._temporary_name)
+
+    def close(self) -> dict:
+        tail = self._compressor.flush()
+        self.compressed_size += len(tail)
+        self._pipe.write(tail)
+        self._pipe.close()
+        self._uploader.join()
+        if self._error is not None:
+            raise self._error
+
+        content_hash = self._hash.hexdigest()
+        object_name = f"{self.prefix}{content_hash}{self.extension}"
+        uploaded = not exists(self.client, self.bucket, object_name)
+        if uploaded:
+            # compose rather than copy: a single server-side copy is limited to 5 GiB, compose splits larger
+            # objects into part copies
+            self.client.compose_object(self.bucket, object_name, [ComposeSource(self.bucket, self._temporary_name)])
+        self.client.remove_object(self.bucket, self._temporary_name)
+        return {"object_name": object_name, "content_hash": content_hash, "size": self.size,
+                "compressed_size": self.compressed_size, "uploaded": uploaded}
+
+
+def exists(client: Minio, bucket, object_name) -> bool:
+    try:
+        client.stat_object(bucket, object_name)
+        return True
+    except S3Error as e:
+        if e.code in ('NoSuchKey', 'NoSuchObject', 'NotFound'):
+            return False
+        raise
+
+
+def put_bytes(client: Minio, bucket, payload: bytes, prefix='', compression=None,
+              content_type='application/octet-stream', extension='') -> dict:
+    # the hash is known up front, so an identical payload is never sent at all
+    content_hash = hashlib.sha256(payload).hexdigest()
+    object_name = f"{prefix}{content_hash}{extension}{_EXTENSIONS[compression]}"
+    if exists(client, bucket, object_name):
+        return {"object_name": object_name, "content_hash": content_hash, "size": len(payload),
+                "compressed_size": None, "uploaded": False}
+    writer = ObjectWriter(client, bucket, prefix, compression, content_type, extension)
+    for i in range(0, len(payload), config.stream_chunk_size):
+        writer.write(payload[i:i + config.stream_chunk_size])
+    return writer.close()
+
+
+def serialize_record(record) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+
+
+def records_writer(client: Minio, bucket, prefix='', compression=None) -> ObjectWriter:
+    return ObjectWriter(client, bucket, prefix, compression, 'application/x-ndjson', '.jsonl')
+
+
+def tee_records(writer: ObjectWriter, records):
+    # archives each record as it passes through to whoever consumes the stream
+    for record in records:
+        writer.write(serialize_record(record))
+        yield record
+
+
+def put_records(client: Minio, bucket, records, prefix='', compression=None) -> dict:
+    writer = records_writer(client, bucket, prefix, compression)
+    try:
+        for record in records:
+            writer.write(serialize_record(record))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
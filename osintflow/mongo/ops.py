@@ -1,49 +1,316 @@
 import hashlib
 import json
-from typing import List, Dict
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable
 
-from deepdiff import DeepDiff
+from bson import json_util
 from pymongo import UpdateOne
 from pymongo.collection import Collection
 from pymongo.results import BulkWriteResult
 
+import osintflow.config as config
+import osintflow.metrics as metrics
+import osintflow.util as util
+from osintflow import connection
 
-def upsert_or_revoke(documents: List[Dict], collection: Collection, compare_field: str):
-    # if compare_field == "_id":
-    #     raise Exception("_id cannot be as compare_field")
+# deepdiff pulls in pandas when it is installed; fingerprint mode never needs it
+deepdiff = util.lazy_import('deepdiff')
+
+DEFAULT_FINGERPRINT_FIELD = "custom_raw_data_hash"
+
+
+def get_collection(configure: dict, database_key='mongodb_database', collection_key='mongodb_collection') -> Collection:
+    client = connection.mongo_client(configure)
+    return client[configure[database_key]][configure[collection_key]]
+
+
+def fingerprint(document: dict) -> str:
+    return util.content_hash(document['custom_raw_data'])
 
-    def fill_empty_id_field(document: dict):
-        if "_id" in document:
-            return document
-        document['_id'] = hashlib.sha256(json.dumps(document).encode()).hexdigest()
+
+def _fill_empty_id_field(document: dict):
+    if "_id" in document:
         return document
+    document['_id'] = hashlib.sha256(json.dumps(document).encode()).hexdigest()
+    return document
+
+
+def _find_existing(documents: List[Dict], collection: Collection, compare_field: str, fingerprint_field: str = None):
+    query = {"custom_raw_data." + compare_field: {'$in': [document['custom_raw_data'][compare_field]
+                                                          for document in documents]}, 'revoked': False}
+    if fingerprint_field is None:
+        found_results = list(collection.find(query))
+    else:
+        found_results = list(collection.find(query, {"custom_raw_data." + compare_field: 1, fingerprint_field: 1}))
+
+        # documents stored before fingerprinting was enabled have no hash yet: hash their bodies once here
+        legacy_ids = [result['_id'] for result in found_results if fingerprint_field not in result]
+        if legacy_ids:
+            legacy_hashes = {legacy['_id']: fingerprint(legacy)
+                             for legacy in collection.find({'_id': {'$in': legacy_ids}}, {'custom_raw_data': 1})}
+            for result in found_results:
+                if result['_id'] in legacy_hashes:
+                    result[fingerprint_field] = legacy_hashes[result['_id']]
 
-    documents = [fill_empty_id_field(document) for document in documents]
-    found_results = list(collection.find(
-        {"custom_raw_data." + compare_field: {'$in': [document['custom_raw_data'][compare_field]
-                                                      for document in documents]}, 'revoked': False}
-    ))
     result_as_dict = {result['custom_raw_data'][compare_field]: result for result in found_results}
 
     if len(result_as_dict.keys()) != len(found_results):
         raise Exception("Duplicated key exists in compare_field")
+    return result_as_dict
+
+
+def _is_changed(exist_doc: dict, document: dict, fingerprint_field: str = None) -> bool:
+    if fingerprint_field is not None:
+        return exist_doc[fingerprint_field] != document[fingerprint_field]
+    if 'revoked' in exist_doc:
+        del exist_doc['revoked']
+    return bool(deepdiff.DeepDiff(exist_doc['custom_raw_data'], document['custom_raw_data']))
+
 
+def _build_operations(documents: List[Dict], result_as_dict: dict, compare_field: str, fingerprint_field: str = None):
     bulk_operations = []
     for document in documents:
         exist_doc = result_as_dict[document['custom_raw_data'][compare_field]] \
             if document['custom_raw_data'][compare_field] in result_as_dict else None
 
         if exist_doc:
-            if 'revoked' in exist_doc:
-                del exist_doc['revoked']
-            if DeepDiff(exist_doc['custom_raw_data'], document['custom_raw_data']):
+            if _is_changed(exist_doc, document, fingerprint_field):
                 bulk_operations.append(UpdateOne({'_id': exist_doc['_id']}, {'$set': {'revoked': True}}, upsert=True))
                 document['revoked'] = False
                 bulk_operations.append(UpdateOne({'_id': document['_id']}, {'$set': document}, upsert=True))
         else:
             document['revoked'] = False
             bulk_operations.append(UpdateOne({'_id': document['_id']}, {'$set': document}, upsert=True))
+    return bulk_operations
+
+
+def _prepare(documents: List[Dict], fingerprint_field: str = None) -> List[Dict]:
+    documents = [_fill_empty_id_field(document) for document in documents]
+    if fingerprint_field is not None:
+        for document in documents:
+            document[fingerprint_field] = fingerprint(document)
+    return documents
+
+
+def upsert_or_revoke(documents: List[Dict], collection: Collection, compare_field: str, fingerprint_field: str = None):
+    # if compare_field == "_id":
+    #     raise Exception("_id cannot be as compare_field")
+
+    # with fingerprint_field set, each stored document carries a hash of its custom_raw_data and the lookup
+    # only projects compare_field + hash, so unchanged documents are skipped without fetching their bodies
+    with metrics.stage('mongo.lookup') as stage:
+        documents = _prepare(documents, fingerprint_field)
+        result_as_dict = _find_existing(documents, collection, compare_field, fingerprint_field)
+        bulk_operations = _build_operations(documents, result_as_dict, compare_field, fingerprint_field)
+        stage.add(records_in=len(documents), records_out=len(bulk_operations))
 
     if bulk_operations:
-        return collection.bulk_write(bulk_operations, ordered=False)
+        return _bulk_write(collection, bulk_operations, metrics.stage('mongo.bulk_write'))
     return BulkWriteResult({}, False)
+
+
+def _bulk_write(collection: Collection, bulk_operations, stage) -> BulkWriteResult:
+    # the stage is created by the caller, so it is recorded even when this runs on the writer thread
+    with stage:
+        stage.add(records_in=len(bulk_operations))
+        return collection.bulk_write(bulk_operations, ordered=False)
+
+
+class Checkpoint:
+    # last processed _id of the initial scan and the change stream resume token, kept in a JSON file. The source
+    # only moves the position in memory as it yields; the file moves when a store commits a position it took
+    # with mark() and has since written, or when the job that read it has finished
+    def __init__(self, path):
+        self.path = path
+        self.last_id = None
+        self.resume_token = None
+        self._consumed = (None, None)
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json_util.loads(f.read())
+            self.last_id = state.get('last_id')
+            self.resume_token = state.get('resume_token')
+        self._consumed = (self.last_id, self.resume_token)
+
+    def advance(self, last_id=None, resume_token=None):
+        # called before a document is yielded; the one yielded before it is the last one fully consumed
+        self._consumed = (self.last_id, self.resume_token)
+        if last_id is not None:
+            self.last_id = last_id
+        if resume_token is not None:
+            self.resume_token = resume_token
+
+    def mark(self) -> tuple:
+        # everything up to this position has been handed downstream; the document being read may not be yet
+        # (a FlatMap stage can be halfway through its items)
+        return self._consumed
+
+    def commit(self, position):
+        last_id, resume_token = position
+        with self._lock:
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(json_util.dumps({"last_id": last_id, "resume_token": resume_token}))
+            os.replace(tmp_path, self.path)
+
+    def save(self):
+        self.commit((self.last_id, self.resume_token))
+
+
+class UpsertSummary:
+    # BulkWriteResult-like aggregate over the per-chunk results of upsert_or_revoke_chunked
+    def __init__(self):
+        self.acknowledged = True
+        self.chunks = 0
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_count = 0
+
+    def add(self, result: BulkWriteResult):
+        self.chunks += 1
+        if not result.acknowledged:
+            return
+        self.inserted_count += result.inserted_count
+        self.matched_count += result.matched_count
+        self.modified_count += result.modified_count
+        self.deleted_count += result.deleted_count
+        self.upserted_count += result.upserted_count
+
+    @property
+    def bulk_api_result(self) -> dict:
+        return {"nInserted": self.inserted_count, "nMatched": self.matched_count, "nModified": self.modified_count,
+                "nRemoved": self.deleted_count, "nUpserted": self.upserted_count, "nChunks": self.chunks}
+
+
+def upsert_or_revoke_chunked(documents: Iterable[Dict], collection: Collection, compare_field: str,
+                             fingerprint_field: str = None, chunk_size: int = None,
+                             checkpoint: Checkpoint = None) -> UpsertSummary:
+    # documents may be any iterable; at most two chunks are held at once because the lookup of chunk N+1
+    # runs while the bulk_write of chunk N is still in flight. A chunk sharing a compare key with the chunk in
+    # flight waits for that write first, otherwise its lookup could miss the key (inserting it twice) or
+    # compare against the state before the write. With the checkpoint of the source streaming documents, the
+    # source position reached by a chunk is committed once that chunk (and every one before it) is written
+    summary = UpsertSummary()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='osintflow_bulk_write_') as writer:
+        pending = None
+        pending_keys = set()
+        pending_position = None
+
+        def collect():
+            summary.add(pending.result())
+            if checkpoint is not None:
+                checkpoint.commit(pending_position)
+
+        for chunk in util.chunked(documents, chunk_size or config.mongo_chunk_size):
+            position = checkpoint.mark() if checkpoint is not None else None
+            keys = {document['custom_raw_data'][compare_field] for document in chunk}
+            if pending is not None and not keys.isdisjoint(pending_keys):
+                collect()
+                pending = None
+            with metrics.stage('mongo.lookup') as stage:
+                # shallow copies: the input may still be lazily deduplicated against documents already seen
+                chunk = _prepare([dict(document) for document in chunk], fingerprint_field)
+                result_as_dict = _find_existing(chunk, collection, compare_field, fingerprint_field)
+                bulk_operations = _build_operations(chunk, result_as_dict, compare_field, fingerprint_field)
+                stage.add(records_in=len(chunk), records_out=len(bulk_operations))
+                del chunk, result_as_dict
+
+            if pending is not None:
+                collect()
+                pending = None
+            if bulk_operations:
+                pending = writer.submit(_bulk_write, collection, bulk_operations, metrics.stage('mongo.bulk_write'))
+                pending_keys = keys
+                pending_position = position
+            else:
+                summary.chunks += 1
+                if checkpoint is not None:
+                    checkpoint.commit(position)
+        if pending is not None:
+            collect()
+    return summary
+
+
+def backfill_fingerprints(collection: Collection, fingerprint_field: str = DEFAULT_FINGERPRINT_FIELD,
+                          batch_size: int = 1000) -> int:
+    backfilled = 0
+    bulk_operations = []
+    cursor = collection.find({fingerprint_field: {'$exists': False}, 'custom_raw_data': {'$exists': True}},
+                             {'custom_raw_data': 1}, batch_size=batch_size)
+    for document in cursor:
+        bulk_operations.append(UpdateOne({'_id': document['_id']}, {'$set': {fingerprint_field: fingerprint(document)}}))
+        if len(bulk_operations) >= batch_size:
+            backfilled += collection.bulk_write(bulk_operations, ordered=False).modified_count
+            bulk_operations = []
+    if bulk_operations:
+        backfilled += collection.bulk_write(bulk_operations, ordered=False).modified_count
+    return backfilled
+
+
+def _project(document: dict, projection) -> dict:
+    if not projection:
+        return document
+    included = [field for field, value in projection.items() if value and field != '_id']
+    if included:
+        projected = {field: document[field] for field in included if field in document}
+        if projection.get('_id', 1) and '_id' in document:
+            projected['_id'] = document['_id']
+        return projected
+    return {field: value for field, value in document.items() if projection.get(field, 1)}
+
+
+def _scan(collection: Collection, query: dict, projection, batch_size: int, checkpoint: Checkpoint = None):
+    # _id is always read, it is the paging key; a projection excluding it is applied afterwards
+    strip_id = bool(projection) and not projection.get('_id', 1)
+    fetch_projection = projection
+    if strip_id:
+        fetch_projection = {field: value for field, value in projection.items() if field != '_id'} or None
+    last_id = checkpoint.last_id if checkpoint is not None else None
+    while True:
+        page_query = query if last_id is None else {'$and': [query, {'_id': {'$gt': last_id}}]}
+        batch = list(collection.find(page_query, fetch_projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        for document in batch:
+            if checkpoint is not None:
+                checkpoint.advance(last_id=document['_id'])
+            yield _project(document, projection) if strip_id else document
+        last_id = batch[-1]['_id']
+
+
+def iter_documents(collection: Collection, query: dict, projection=None, batch_size: int = None,
+                   checkpoint: Checkpoint = None, tail=False):
+    # pages through the collection sorted by _id ($gt the last seen _id instead of skip), so memory stays at one
+    # batch and a crashed run resumes from the checkpoint; the position is only moved in memory here, it is
+    # saved by whoever writes the documents (see Checkpoint)
+    batch_size = batch_size or config.mongo_chunk_size
+    resume_token = checkpoint.resume_token if checkpoint is not None else None
+    if not tail:
+        if resume_token is None:
+            yield from _scan(collection, query, projection, batch_size, checkpoint)
+        return
+
+    # change streams need a replica set; only top-level equality / operator filters are carried over
+    pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']},
+                            **{'fullDocument.' + field: value for field, value in query.items()
+                               if not field.startswith('$')}}}]
+    if resume_token is None:
+        # the stream position is taken before the scan, so changes made while scanning are replayed after it
+        with collection.watch(pipeline, full_document='updateLookup') as changes:
+            resume_token = changes.resume_token
+        yield from _scan(collection, query, projection, batch_size, checkpoint)
+        if checkpoint is not None:
+            checkpoint.advance(resume_token=resume_token)
+
+    with collection.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as changes:
+        for change in changes:
+            if change.get('fullDocument') is None:
+                continue
+            if checkpoint is not None:
+                checkpoint.advance(resume_token=change['_id'])
+            yield _project(change['fullDocument'], projection)
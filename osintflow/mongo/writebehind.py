@@ -0,0 +1,317 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from bson import ObjectId, json_util
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+import osintflow.config as config
+from osintflow.mongo import ops as mongo_ops
+
+
+class _Batch:
+    def __init__(self, seq, records, summary=None, on_written=None):
+        self.seq = seq
+        self.records = records
+        self.summary = summary
+        self.on_written = on_written
+        self.enqueued = time.perf_counter()
+
+
+def _insert_once(collection: Collection, records) -> int:
+    # insert_many that can be repeated: a retry after a partial write, or a journal replay after a crash
+    # between the write and its ack, finds some records already written; those duplicate _ids are skipped
+    try:
+        return len(collection.insert_many(records, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])) \
+                or e.details.get('writeConcernErrors'):
+            raise
+        return e.details.get('nInserted', 0)
+
+
+class WriteBehind:
+    # bounded in-memory buffer in front of one collection: put() returns as soon as the records are queued
+    # (blocking only while the queue is full) and a background worker writes them with upsert_or_revoke
+    # (insert_many when compare_field is None) once flush_size records are waiting or the oldest has waited
+    # flush_interval seconds. With a journal path every batch is appended to a JSON lines file before it is
+    # queued and acknowledged after it is written, so batches still pending when the process dies (or Mongo is
+    # down) are replayed by the next WriteBehind on the same journal
+    def __init__(self, collection: Collection, compare_field=None, fingerprint_field=None, journal=None,
+                 flush_size=None, flush_interval=None, max_queue_size=None):
+        self.collection = collection
+        self.compare_field = compare_field
+        self.fingerprint_field = fingerprint_field
+        self.journal = journal
+        self.flush_size = flush_size or config.write_behind_flush_size
+        self.flush_interval = flush_interval or config.write_behind_flush_interval
+        self.max_queue_size = max_queue_size or config.write_behind_queue_size
+        self._condition = threading.Condition()
+        self._batches = deque()
+        self._queued = 0
+        self._in_flight = 0
+        self._flush_requests = 0
+        self._closing = False
+        self._seq = 0
+        self._failure = None
+        self._retry_at = 0.0
+        self._stats = {"enqueued": 0, "flushed": 0, "flushes": 0, "failed_flushes": 0, "replayed": 0,
+                       "max_queue_depth": 0, "flush_seconds_total": 0.0, "flush_seconds_max": 0.0,
+                       "queue_latency_max": 0.0}
+        if journal is not None:
+            self._replay()
+        self._worker = threading.Thread(target=self._work, daemon=True, name='osintflow_write_behind_')
+        self._worker.start()
+
+    def put(self, records, summary: mongo_ops.UpsertSummary = None, timeout=None, on_written=None):
+        # summary collects the write results of these records, so a job can report its own counts;
+        # on_written() is called on the worker thread once they are written, batches in the order they were put
+        records = list(records)
+        if not records:
+            return
+        if self.compare_field is None:
+            # _id fixed before the journal entry, so a replayed insert is recognised as a duplicate
+            for record in records:
+                record.setdefault('_id', ObjectId())
+        with self._condition:
+            if self._closing:
+                raise RuntimeError("cannot put after close")
+
+            def has_room():
+                # a batch larger than the whole queue is still accepted once the queue is empty
+                pending = self._queued + self._in_flight
+                return not pending or pending + len(records) <= self.max_queue_size
+
+            if not self._condition.wait_for(has_room, timeout):
+                raise TimeoutError(f"write-behind queue full ({self._queued + self._in_flight} records)")
+            self._seq += 1
+            batch = _Batch(self._seq, records, summary, on_written)
+            if self.journal is not None:
+                self._append_journal({"seq": batch.seq, "records": records})
+            self._batches.append(batch)
+            self._queued += len(records)
+            self._stats['enqueued'] += len(records)
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queued + self._in_flight)
+            self._condition.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        # blocks until everything put so far is written; False if that did not happen within timeout
+        with self._condition:
+            self._flush_requests += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(lambda: not self._batches and not self._in_flight, timeout)
+            finally:
+                self._flush_requests -= 1
+
+    def close(self, timeout=None) -> bool:
+        flushed = self.flush(timeout if timeout is not None else config.write_behind_flush_timeout)
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            if not flushed:
+                left = self._queued + self._in_flight
+                print(f"WARNING: write-behind for {self.collection.full_name} closed with {left} records unwritten"
+                      + (f", kept in {self.journal}" if self.journal is not None else ""))
+        self._worker.join(timeout)
+        return flushed
+
+    @property
+    def name(self) -> str:
+        # a collection can have several writers: one per compare field (None: the inserting log writer) and journal
+        return f"{self.collection.full_name}:{self.compare_field or '_id'}" \
+            + (f":{self.journal}" if self.journal is not None else "")
+
+    def stats(self) -> dict:
+        with self._condition:
+            flushes = self._stats['flushes']
+            return {
+                "queue_depth": self._queued + self._in_flight,
+                "max_queue_depth": self._stats['max_queue_depth'],
+                "enqueued": self._stats['enqueued'],
+                "flushed": self._stats['flushed'],
+                "replayed": self._stats['replayed'],
+                "flushes": flushes,
+                "failed_flushes": self._stats['failed_flushes'],
+                "flush_seconds_avg": self._stats['flush_seconds_total'] / flushes if flushes else 0.0,
+                "flush_seconds_max": self._stats['flush_seconds_max'],
+                "queue_latency_max": self._stats['queue_latency_max'],
+                "last_error": repr(self._failure) if self._failure is not None else None,
+            }
+
+    def _ready(self) -> bool:
+        if not self._batches or time.perf_counter() < self._retry_at:
+            return False
+        return (self._closing or self._flush_requests or self._queued >= self.flush_size
+                or time.perf_counter() - self._batches[0].enqueued >= self.flush_interval)
+
+    def _next_wakeup(self) -> float:
+        if not self._batches:
+            return self.flush_interval
+        due = max(self._retry_at, self._batches[0].enqueued + self.flush_interval)
+        return max(0.0, due - time.perf_counter())
+
+    def _take(self) -> list:
+        # whole batches, oldest first, of one owner (summary) at a time and up to flush_size records
+        group = [self._batches.popleft()]
+        size = len(group[0].records)
+        while self._batches and self._batches[0].summary is group[0].summary \
+                and size + len(self._batches[0].records) <= self.flush_size:
+            group.append(self._batches.popleft())
+            size += len(group[-1].records)
+        self._queued -= size
+        self._in_flight = size
+        return group
+
+    def _work(self):
+        failures = 0
+        while True:
+            with self._condition:
+                while not self._ready():
+                    if self._closing and not self._batches:
+                        return
+                    self._condition.wait(self._next_wakeup())
+                if self._closing and failures:
+                    # the final flush already gave up on an unreachable server; the journal keeps the rest
+                    return
+                group = self._take()
+
+            started = time.perf_counter()
+            try:
+                self._write(group)
+            except Exception as e:
+                failures += 1
+                delay = min(config.write_behind_retry_max, config.page_backoff * 2 ** failures)
+                print(f"WARNING: write-behind flush to {self.collection.full_name} failed, retrying in {delay}s:", e)
+                with self._condition:
+                    self._failure = e
+                    self._stats['failed_flushes'] += 1
+                    # back to the head of the queue, in order, for the next attempt
+                    self._batches.extendleft(reversed(group))
+                    self._queued += self._in_flight
+                    self._in_flight = 0
+                    self._retry_at = time.perf_counter() + delay
+                    self._condition.notify_all()
+                continue
+
+            failures = 0
+            finished = time.perf_counter()
+            with self._condition:
+                self._failure = None
+                self._in_flight = 0
+                self._stats['flushes'] += 1
+                self._stats['flushed'] += sum(len(batch.records) for batch in group)
+                self._stats['flush_seconds_total'] += finished - started
+                self._stats['flush_seconds_max'] = max(self._stats['flush_seconds_max'], finished - started)
+                self._stats['queue_latency_max'] = max(self._stats['queue_latency_max'],
+                                                       finished - group[0].enqueued)
+                if self.journal is not None:
+                    self._append_journal({"ack": group[-1].seq})
+                    if not self._batches:
+                        self._truncate_journal()
+                self._condition.notify_all()
+            for batch in group:
+                if batch.on_written is not None:
+                    try:
+                        batch.on_written()
+                    except Exception as e:
+                        print(f"WARNING: write-behind callback for {self.collection.full_name} failed:", e)
+
+    def _write(self, group):
+        records = [record for batch in group for record in batch.records]
+        summary = group[0].summary
+        if self.compare_field is None:
+            inserted = _insert_once(self.collection, records)
+            if summary is not None:
+                summary.chunks += 1
+                summary.inserted_count += inserted
+            return
+        result = mongo_ops.upsert_or_revoke(records, self.collection, self.compare_field, self.fingerprint_field)
+        if summary is not None:
+            summary.add(result)
+
+    def _append_journal(self, entry):
+        with open(self.journal, 'a') as f:
+            f.write(json_util.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_journal(self):
+        open(self.journal, 'w').close()
+
+    def _replay(self):
+        if not os.path.exists(self.journal):
+            return
+        pending = {}
+        with open(self.journal, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json_util.loads(line)
+                except ValueError:
+                    # torn last line of a crashed write; that batch was never acknowledged to its producer
+                    continue
+                if 'ack' in entry:
+                    for seq in [seq for seq in pending if seq <= entry['ack']]:
+                        del pending[seq]
+                else:
+                    pending[entry['seq']] = entry['records']
+        # renumbered from 1 and rewritten, so the journal only ever holds what is still pending
+        self._truncate_journal()
+        for records in pending.values():
+            self._seq += 1
+            self._append_journal({"seq": self._seq, "records": records})
+            self._batches.append(_Batch(self._seq, records))
+            self._queued += len(records)
+            self._stats['replayed'] += len(records)
+
+
+class _WriteBehindRegistry:
+    # one WriteBehind per target collection and journal for the whole process; closed (and so flushed) at exit.
+    # A journal belongs to a single writer: the log writer of a config keeps its own next to the data journal
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writers = {}
+
+    def get(self, configure: dict, compare_field=None, logging=False) -> WriteBehind:
+        journal = configure.get('mongodb_journal')
+        if journal is not None and logging:
+            journal += '.log'
+        key = (configure['mongodb_uri'], configure['mongodb_database'], configure['mongodb_collection'],
+               compare_field, journal)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                if journal is not None and any(other.journal == journal for other in self._writers.values()):
+                    raise ValueError(f"Journal {journal} is already used by another write-behind target")
+                writer = WriteBehind(mongo_ops.get_collection(configure), compare_field,
+                                     None if logging else configure.get('mongodb_fingerprint_field'),
+                                     journal=journal,
+                                     flush_size=configure.get('mongodb_flush_size'),
+                                     flush_interval=configure.get('mongodb_flush_interval'),
+                                     max_queue_size=configure.get('mongodb_queue_size'))
+                self._writers[key] = writer
+            return writer
+
+    def stats(self) -> dict:
+        with self._lock:
+            writers = list(self._writers.values())
+        return {writer.name: writer.stats() for writer in writers}
+
+    def close(self):
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+        for writer in writers:
+            writer.close()
+
+
+_registry = _WriteBehindRegistry()
+get = _registry.get
+stats = _registry.stats
+close = _registry.close
+atexit.register(close)
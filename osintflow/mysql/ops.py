@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable
+
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, Float, MetaData, String, Table, Text, inspect
+from sqlalchemy.dialects import mysql, sqlite
+
+import osintflow.util as util
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _column_type(value, key=False):
+    if isinstance(value, bool):
+        return Boolean()
+    if isinstance(value, int):
+        return BigInteger()
+    if isinstance(value, float):
+        return Float()
+    if isinstance(value, datetime):
+        return DateTime()
+    if isinstance(value, date):
+        return Date()
+    # MySQL cannot index TEXT columns, so the compare field gets a bounded VARCHAR
+    return String(255) if key else Text()
+
+
+def get_table(engine, table_name: str, sample_row: Dict = None, compare_field: str = None) -> Table:
+    # reflected once per engine and table; created from the sample row's value types when it does not exist yet
+    key = (str(engine.url), table_name)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is not None:
+            return table
+        metadata = MetaData()
+        if inspect(engine).has_table(table_name):
+            table = Table(table_name, metadata, autoload_with=engine)
+        elif sample_row is not None:
+            table = Table(table_name, metadata,
+                          *[Column(column, _column_type(value, column == compare_field),
+                                   primary_key=column == compare_field)
+                            for column, value in sample_row.items()])
+            metadata.create_all(engine)
+        else:
+            raise ValueError(f"Table {table_name} does not exist")
+        _tables[key] = table
+        return table
+
+
+def _sample_row(batch, keys) -> Dict:
+    # the first non-null value of every key, for the column types of a new table
+    return {key: next((row[key] for row in batch if row.get(key) is not None), None) for key in keys}
+
+
+def _insert_statement(engine, table: Table, columns, compare_field=None, if_row_exists="update"):
+    dialect = engine.dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table)
+        if compare_field is None:
+            return statement
+        if if_row_exists == "ignore":
+            return statement.prefix_with('IGNORE')
+        return statement.on_duplicate_key_update({column: statement.inserted[column]
+                                                  for column in columns if column != compare_field})
+    if dialect == 'sqlite':
+        statement = sqlite.insert(table)
+        if compare_field is None:
+            return statement
+        if if_row_exists == "ignore":
+            return statement.on_conflict_do_nothing(index_elements=[compare_field])
+        return statement.on_conflict_do_update(index_elements=[compare_field],
+                                               set_={column: statement.excluded[column]
+                                                     for column in columns if column != compare_field})
+    if compare_field is not None:
+        raise ValueError(f"Bulk upsert is not supported for {dialect}")
+    return table.insert()
+
+
+def bulk_load(rows: Iterable[Dict], engine, table_name: str, compare_field: str = None, if_row_exists="update",
+              batch_size: int = 5000) -> dict:
+    # streams rows straight into executemany batches of a multi-row INSERT (... ON DUPLICATE KEY UPDATE when
+    # compare_field is given) over one pooled connection, without building DataFrames. A new table gets the
+    # columns of every row in the first batch; keys the table has no column for raise instead of being dropped
+    start = time.perf_counter()
+    loaded = 0
+    batches = 0
+    table = None
+    statement = None
+    columns = []
+    with engine.connect() as connection:
+        for batch in util.chunked(rows, batch_size):
+            keys = list(dict.fromkeys(key for row in batch for key in row))
+            if table is None:
+                table = get_table(engine, table_name, _sample_row(batch, keys), compare_field)
+            new_columns = [key for key in keys if key not in columns]
+            if new_columns:
+                unknown = [column for column in new_columns if column not in table.c]
+                if unknown:
+                    raise ValueError(f"Table {table_name} has no columns {unknown}")
+                columns += new_columns
+                statement = _insert_statement(engine, table, columns, compare_field, if_row_exists)
+            connection.execute(statement, [{column: row.get(column) for column in columns} for row in batch])
+            connection.commit()
+            loaded += len(batch)
+            batches += 1
+    elapsed = time.perf_counter() - start
+    return {"rows": loaded, "batches": batches, "seconds": elapsed,
+            "rows_per_second": loaded / elapsed if elapsed else 0.0}
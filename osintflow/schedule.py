@@ -0,0 +1,150 @@
+import atexit
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+from osintflow.concurrent import _concurrent
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        if value_range == '*':
+            start, end = low, high
+        elif '-' in value_range:
+            start, end = (int(value) for value in value_range.split('-'))
+        else:
+            start = int(value_range)
+            end = high if step else start
+        if start < low or end > high:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class Cron:
+    # minute hour day-of-month month day-of-week (0 = Sunday); supports *, a-b, a,b and /step
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {weekday % 7 for weekday in _parse_cron_field(fields[4], 0, 7)}
+        # as in cron, a restricted day-of-month and a restricted day-of-week match when either does
+        self._either_day = fields[2] != '*' and fields[4] != '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        return day or weekday if self._either_day else day and weekday
+
+    def next_time(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+
+class Interval:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_time(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds)
+
+
+class RecurringJob:
+    def __init__(self, trigger, func, args, kwargs, source):
+        self.trigger = trigger
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.source = source
+        self.next_run = trigger.next_time(datetime.now())
+        self.future = None
+        self.runs = 0
+        self.skipped = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Scheduler:
+    # a single timer thread submits due jobs into the shared _concurrent pool; a run is skipped while the
+    # previous run of the same job is still queued or running, and submit blocks when the pool queue is full
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._heap = []
+        self._counter = itertools.count()
+        self._thread = None
+        self._stopped = False
+
+    def _schedule(self, trigger, func, args, kwargs, source=None) -> RecurringJob:
+        job = RecurringJob(trigger, func, args, kwargs, source)
+        with self._lock:
+            heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+            self._stopped = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True, name='osintflow_scheduler')
+                self._thread.start()
+            self._wakeup.notify()
+        return job
+
+    def every(self, seconds, func, *args, source=None, **kwargs) -> RecurringJob:
+        return self._schedule(Interval(seconds), func, args, kwargs, source)
+
+    def cron(self, expression, func, *args, source=None, **kwargs) -> RecurringJob:
+        return self._schedule(Cron(expression), func, args, kwargs, source)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._heap or self._heap[0][0] > datetime.now()):
+                    timeout = (self._heap[0][0] - datetime.now()).total_seconds() if self._heap else None
+                    self._wakeup.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            if job.future is not None and not job.future.done():
+                job.skipped += 1
+            else:
+                job.runs += 1
+                job.future = _concurrent.submit_task(job.func, job.args, job.kwargs, source=job.source)
+            job.next_run = job.trigger.next_time(max(job.next_run, datetime.now()))
+            with self._lock:
+                heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+
+    def jobs(self) -> list:
+        with self._lock:
+            return [job for _, _, job in sorted(self._heap, key=lambda entry: entry[:2]) if not job.cancelled]
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+
+
+_scheduler = _Scheduler()
+every = _scheduler.every
+cron = _scheduler.cron
+atexit.register(_scheduler.stop)
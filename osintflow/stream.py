@@ -0,0 +1,246 @@
+import codecs
+import itertools
+import json
+import re
+
+import osintflow.util as util
+from osintflow.concurrent import _concurrent
+
+osint_encoding = util.lazy_import('osintflow.encoding')
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+class CountingIterator:
+    # lets store_log report crawl_counts for streamed records without materializing them; with size (e.g. len)
+    # the items' sizes are added up in `bytes` as well
+    def __init__(self, iterable, size=None):
+        self._iterator = iter(iterable)
+        self.count = 0
+        self.bytes = 0
+        self._size = size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.count += 1
+        if self._size is not None:
+            self.bytes += self._size(item)
+        return item
+
+
+class Tee:
+    # passes items through, handing each one to the sinks attached so far as well; lets a decorator further
+    # down archive a body that is read as a stream
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.sinks = []
+        self.started = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.started = True
+        for sink in self.sinks:
+            sink(item)
+        return item
+
+
+def count(data) -> int:
+    if data is None:
+        return 0
+    if isinstance(data, CountingIterator):
+        return data.count
+    if hasattr(data, '__len__'):
+        return len(data)
+    return 0
+
+
+def is_stream(data) -> bool:
+    return data is not None and not isinstance(data, (list, dict, str, bytes)) and hasattr(data, '__next__')
+
+
+def is_pull_through(handler) -> bool:
+    # stages that hand each record on as soon as it is read, without reading ahead
+    return isinstance(handler, Map) and not isinstance(handler, ParallelMap)
+
+
+class Map:
+    # per-record dataflow stages: each wraps the incoming records in a generator, so a chain of stages
+    # is evaluated lazily, one record at a time, by whichever store decorator consumes it
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, records):
+        return (self.func(record) for record in records)
+
+
+class Filter(Map):
+    def __call__(self, records):
+        return (record for record in records if self.func(record))
+
+
+class FlatMap(Map):
+    def __call__(self, records):
+        return (item for record in records for item in self.func(record))
+
+
+class Peek(Map):
+    def __call__(self, records):
+        for record in records:
+            self.func(record)
+            yield record
+
+
+class ParallelMap(Map):
+    # like Map, but records are shipped in chunks to a process (or thread) pool; func must be picklable
+    def __init__(self, func, backend='process', chunk_size=None, max_workers=None):
+        super().__init__(func)
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+
+    def __call__(self, records):
+        return _concurrent.parallel_map(self.func, records, self.backend, self.chunk_size, self.max_workers)
+
+
+def iter_decoded(byte_chunks, encoding):
+    # as in encoding.decode, a BOM at the start of the body overrides the charset given (and is dropped)
+    byte_chunks = iter(byte_chunks)
+    head = b''
+    for chunk in byte_chunks:
+        head += chunk
+        if len(head) >= 4:
+            break
+    encoding = osint_encoding.bom_encoding(head) or encoding
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in itertools.chain([head], byte_chunks):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def iter_lines(text_chunks):
+    pending = ''
+    for chunk in text_chunks:
+        lines = (pending + chunk).splitlines(keepends=True)
+        # a trailing '\r' may be the first half of a '\r\n' split across chunks
+        pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        for line in lines:
+            yield line.rstrip('\r\n')
+    if pending:
+        yield pending.rstrip('\r\n')
+
+
+class _JsonItemReader:
+    def __init__(self, text_chunks):
+        self._chunks = iter(text_chunks)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._exhausted = False
+
+    def _read_more(self) -> bool:
+        if self._exhausted:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._exhausted = True
+            return False
+        if self._pos > 0:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += chunk
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self._pos} of JSON stream")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._read_more():
+                    continue
+                raise
+            # a number at the very end of the buffer may continue in the next chunk
+            if end >= len(self._buffer) and self._read_more():
+                continue
+            self._pos = end
+            return value
+
+    def _seek_array(self, key):
+        if key is None:
+            self._expect('[')
+            return
+        self._expect('{')
+        while True:
+            if self._peek() == '}':
+                raise ValueError(f"Key '{key}' not found in JSON stream")
+            name = self._value()
+            self._expect(':')
+            if name == key:
+                self._expect('[')
+                return
+            self._value()
+            if self._peek() == ',':
+                self._pos += 1
+
+    def items(self, key=None):
+        self._seek_array(key)
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._value()
+            separator = self._peek()
+            self._pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or ']' at offset {self._pos - 1} of JSON stream")
+
+
+def iter_json_items(text_chunks, key=None):
+    # yields the elements of the top-level array, or of the array under top-level `key`, one at a time
+    return _JsonItemReader(text_chunks).items(key)
+
+
+def iter_response(response, stream, encoding, items=None, chunk_size=None, byte_chunks=None):
+    # byte_chunks: response.iter_content(chunk_size) as wrapped by the caller, e.g. to count the bytes read
+    try:
+        if byte_chunks is None:
+            byte_chunks = response.iter_content(chunk_size=chunk_size)
+        if stream == 'bytes':
+            yield from byte_chunks
+            return
+        text_chunks = iter_decoded(byte_chunks, encoding)
+        if stream == 'text':
+            yield from text_chunks
+        elif stream == 'lines':
+            yield from iter_lines(text_chunks)
+        elif stream == 'json':
+            yield from iter_json_items(text_chunks, items)
+        else:
+            raise ValueError(f"Unknown stream mode: {stream}")
+    finally:
+        response.close()
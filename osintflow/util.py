@@ -1,17 +1,70 @@
 import hashlib
+import importlib
+import json
 import re
+from functools import lru_cache
+from itertools import islice
+
+import osintflow.config as config
 
 IP_PATTERN = re.compile(r"\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b")
-DOMAIN_PATTERN = re.compile(r"\\b(https?|ftp|file)://[-a-zA-Z0-9+&@#/%?=~_|!:,.;]*[-a-zA-Z0-9+&@#/%=~_|]")
+DOMAIN_PATTERN = re.compile(r"\b(https?|ftp|file)://[-a-zA-Z0-9+&@#/%?=~_|!:,.;]*[-a-zA-Z0-9+&@#/%=~_|]")
+
+
+_PLACEHOLDER_PATTERN = re.compile(r'(<.*?>)')
+
+
+@lru_cache(maxsize=config.template_cache_size)
+def _compile_statement(statement):
+    return statement.isidentifier(), compile(statement, '<template>', 'eval')
+
+
+def _evaluate(statement, kwargs, globals):
+    is_name, code = _compile_statement(statement)
+    if is_name:
+        # plain <name> placeholders are looked up directly instead of going through eval
+        if statement in kwargs:
+            return kwargs[statement]
+        if globals is not None and statement in globals:
+            return globals[statement]
+    # kwargs are merged into a copy of the globals rather than passed as locals: eval locals are invisible to
+    # nested scopes (lambdas, comprehension clauses), and the caller's globals are never written to
+    return eval(code, {**globals, **kwargs} if globals is not None else dict(kwargs))
 
 
-def parse_template(template, kwargs, globals, locals):
-    for match in re.findall(r'<.*?>', template):
-        statement = match[1:-1]
-        globals.update(kwargs)
-        repl = eval(statement, globals, locals)
-        template = template.replace(match, str(repl))
-    return template
+@lru_cache(maxsize=config.template_cache_size)
+def compile_template(template):
+    parts = _PLACEHOLDER_PATTERN.split(template)
+    if len(parts) == 1:
+        return lambda kwargs, globals=None: template
+    literals = parts[0::2]
+    statements = [part[1:-1] for part in parts[1::2]]
+
+    def render(kwargs, globals=None):
+        rendered = [literals[0]]
+        for statement, literal in zip(statements, literals[1:]):
+            rendered.append(str(_evaluate(statement, kwargs, globals)))
+            rendered.append(literal)
+        return ''.join(rendered)
+
+    return render
+
+
+def compile_params(params):
+    # compiles a str / list / dict of templates once; other values render to None like _replace_param always did
+    if type(params) == str:
+        return compile_template(params)
+    elif type(params) == list:
+        items = [compile_params(item) for item in params]
+        return lambda kwargs, globals=None: [item(kwargs, globals) for item in items]
+    elif type(params) == dict:
+        items = [(compile_params(key), compile_params(value)) for key, value in params.items()]
+        return lambda kwargs, globals=None: {key(kwargs, globals): value(kwargs, globals) for key, value in items}
+    return lambda kwargs, globals=None: None
+
+
+def parse_template(template, kwargs, globals, locals=None):
+    return compile_template(template)(kwargs, globals)
 
 
 def remove_duplicates_by_key(list_of_dicts, key):
@@ -24,3 +77,53 @@ def calculate_md5(input_string):
     md5_hash = hashlib.md5()
     md5_hash.update(input_string.encode('utf-8'))
     return md5_hash.hexdigest()
+
+
+def _tagged(obj):
+    # non-JSON values carry their type, so a datetime never hashes like its str()
+    return {"$type": f"{type(obj).__module__}.{type(obj).__qualname__}", "$value": str(obj)}
+
+
+def _lookup(obj, key):
+    # a dotted key reaches into nested documents, e.g. 'custom_raw_data.id'
+    if key in obj:
+        return obj[key]
+    for part in key.split('.'):
+        obj = obj[part]
+    return obj
+
+
+def content_hash(obj, key=None):
+    if key is not None:
+        obj = [_lookup(obj, k) for k in key]
+    canonical = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_tagged)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _LazyModule:
+    # stands in for a module until one of its attributes is first used, so heavy backends
+    # (pandas, sqlalchemy, pymongo, minio, ...) are only imported by the jobs that need them
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name) -> _LazyModule:
+    return _LazyModule(name)
@@ -11,6 +11,11 @@ setup(
         'requests', 'pangres', 'pandas', 'mysql-connector-python', 'SQLAlchemy', 'setuptools', 'python-dateutil',
         'mysqlclient', 'chardet', 'xmltodict', 'PyYAML'
     ],
+    # local stand-ins for MongoDB and MinIO used by tests/ and benchmark/
+    extras_require={
+        'test': ['pytest', 'mongomock', 'moto[server]', 'minio'],
+        'benchmark': ['mongomock'],
+    },
     author="Ngseo Kim",
     author_email="ngseo@s2w.inc",
     maintainer="DE team",
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# the local stand-ins (HTTP server, synthetic payloads) live with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark'))
+
+import server  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def base_url():
+    url, http_server = server.start()
+    yield url
+    http_server.shutdown()
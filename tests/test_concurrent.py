@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from osintflow.concurrent import _Concurrent
+from osintflow.schedule import Cron, _Scheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_source_limit_holds_and_parked_tasks_fill_the_queue():
+    pool = _Concurrent(max_workers=4, max_queue_size=5)
+    pool.set_limit('feed', 1)
+    release = threading.Event()
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def task():
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        release.wait(5)
+        with lock:
+            running['now'] -= 1
+
+    pool.submit_task(task, source='feed')
+    wait_until(lambda: pool.stats()['running'] == 1)
+    for _ in range(5):
+        pool.submit_task(task, source='feed')
+    # five tasks wait behind the limit of 'feed', so the queue is full although idle workers drained it
+    with pytest.raises(queue.Full):
+        pool.submit_task(task, source='feed', timeout=0.2)
+
+    release.set()
+    assert pool._wait(5)
+    assert running['max'] == 1
+    assert pool.stats()['completed'] == 6
+    pool.shutdown()
+
+
+def test_resize_adds_and_removes_workers():
+    pool = _Concurrent(max_workers=1, max_queue_size=10)
+    pool.resize(3)
+    # only passes when three tasks run at the same time
+    barrier = threading.Barrier(3, timeout=5)
+    futures = [pool.submit(barrier.wait) for _ in range(3)]
+    assert sorted(future.result(5) for future in futures) == [0, 1, 2]
+
+    pool.resize(1)
+    assert pool.stats()['workers'] == 1
+    assert pool.submit(lambda: 'still running').result(5) == 'still running'
+    pool.shutdown()
+
+
+def test_cron_next_time():
+    weekdays = Cron("*/15 9-17 * * 1-5")
+    assert weekdays.next_time(datetime(2026, 10, 16, 9, 7, 30)) == datetime(2026, 10, 16, 9, 15)
+    # Friday evening to Monday morning
+    assert weekdays.next_time(datetime(2026, 10, 16, 17, 45)) == datetime(2026, 10, 19, 9, 0)
+    # day-of-month and day-of-week both restricted: either one matches
+    assert Cron("0 0 13 * 5").next_time(datetime(2026, 10, 14)) == datetime(2026, 10, 16)
+    assert Cron("0 0 13 * 5").next_time(datetime(2026, 11, 12, 1)) == datetime(2026, 11, 13)
+    with pytest.raises(ValueError):
+        Cron("60 * * * *")
+    with pytest.raises(ValueError):
+        Cron("* * *")
+
+
+def test_every_skips_a_run_while_the_previous_one_is_running():
+    scheduler = _Scheduler()
+    release = threading.Event()
+    job = scheduler.every(0.05, release.wait, 5)
+    try:
+        wait_until(lambda: job.skipped >= 2)
+        assert job.runs == 1
+        release.set()
+        wait_until(lambda: job.runs >= 2)
+    finally:
+        scheduler.stop()
+        release.set()
@@ -0,0 +1,30 @@
+from osintflow.core import OsintflowJob, osint
+
+
+class TaggingJob(OsintflowJob):
+    def _handle(self, data, *handlers, **kwargs):
+        return 'tagged', super()._handle(data, *handlers, **kwargs)
+
+
+def double(data):
+    return data * 2
+
+
+def test_thread_branches_run_on_the_scheduling_instance():
+    job = TaggingJob()
+
+    @job.dataflow(lambda _: 3, [double, str], executor='thread')
+    def run():
+        return job.data, job.branch_timings
+
+    data, timings = run()
+    assert data == ('tagged', [('tagged', 6), ('tagged', '3')])
+    assert [timing['branch'] for timing in timings] == [0, 1]
+
+
+def test_process_branches_keep_order_and_keys():
+    @osint.dataflow(lambda _: 21, {'doubled': double, 'text': str}, executor='process', max_workers=2)
+    def run():
+        return osint.data
+
+    assert run() == {'doubled': 42, 'text': '21'}
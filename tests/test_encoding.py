@@ -0,0 +1,22 @@
+import codecs
+import json
+
+from osintflow import encoding
+from osintflow.stream import iter_decoded, iter_json_items
+
+BODY = codecs.BOM_UTF8 + json.dumps({"data": [{"id": "é"}]}).encode('utf-8')
+
+
+def test_bom_wins_over_header_charset():
+    text, report = encoding.decode(BODY, 'application/json; charset=utf-8')
+    assert json.loads(text) == {"data": [{"id": "é"}]}
+    assert report['strategy'] == 'bom'
+    text, report = encoding.decode(codecs.BOM_UTF16_LE + 'café'.encode('utf-16-le'), 'text/plain; charset=latin-1')
+    assert text == 'café'
+
+
+def test_streamed_body_drops_the_bom_split_across_chunks():
+    chunks = [BODY[i:i + 2] for i in range(0, len(BODY), 2)]
+    assert list(iter_json_items(iter_decoded(chunks, 'utf-8'), 'data')) == [{"id": "é"}]
+    assert ''.join(iter_decoded([b'ab', b'c'], 'utf-8')) == 'abc'
+    assert list(iter_decoded([], 'utf-8')) == []
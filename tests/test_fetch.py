@@ -0,0 +1,45 @@
+import asyncio
+import threading
+import time
+
+from osintflow.fetch import AsyncFetcher
+
+
+def test_run_keeps_input_order(base_url):
+    fetcher = AsyncFetcher(limit_per_host=4)
+    requests_ = [{"method": "get", "url": f"{base_url}/threatfox/offset?offset={offset}&limit=10"}
+                 for offset in range(0, 100, 10)]
+    responses = fetcher.run(requests_)
+    assert [response.json()['data'][0]['id'] for response in responses] == [str(offset)
+                                                                             for offset in range(0, 100, 10)]
+
+
+def test_limit_per_host_holds_across_concurrent_runs(base_url):
+    fetcher = AsyncFetcher(limit_per_host=2)
+    requests_ = [{"method": "get", "url": f"{base_url}/headers?latency=0.2&n={i}"} for i in range(4)]
+    threads = [threading.Thread(target=fetcher.run, args=(requests_,)) for _ in range(2)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 8 requests of 0.2s, at most 2 at a time
+    assert time.perf_counter() - start >= 0.75
+
+
+def test_shared_sessions_do_not_keep_cookies(base_url):
+    fetcher = AsyncFetcher()
+    fetcher.run([{"method": "get", "url": f"{base_url}/headers?set_cookie=session=job1"}])
+    echoed = fetcher.run([{"method": "get", "url": f"{base_url}/headers"},
+                          {"method": "get", "url": f"{base_url}/headers", "cookies": {"explicit": "1"}}])
+    assert 'Cookie' not in echoed[0].json()
+    assert echoed[1].json()['Cookie'] == 'explicit=1'
+
+
+def test_run_inside_event_loop(base_url):
+    fetcher = AsyncFetcher()
+
+    async def job():
+        return fetcher.run([{"method": "get", "url": f"{base_url}/headers"}] * 3)
+
+    assert [response.status_code for response in asyncio.run(job())] == [200, 200, 200]
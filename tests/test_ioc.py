@@ -0,0 +1,91 @@
+import json
+from unittest import mock
+
+import pymongo
+import pytest
+
+from osintflow.core import OsintflowJob, osint
+from osintflow.ioc import BloomFilter, ExtractIOCs, iter_iocs
+from osintflow.mongo import ops as mongo_ops
+from osintflow.stream import Map
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def test_iter_iocs_refangs_and_rejects_near_misses():
+    text = ("c2 at hxxps://Bad[.]com/gate.php), 8.8.8.8, see...evil.com and "
+            "d41d8cd98f00b204e9800998ecf8427e; not 1.2.3.4.5, 10.0.0.256 or payload.exe")
+    assert list(iter_iocs(text)) == [('url', 'https://bad.com/gate.php'), ('ipv4', '8.8.8.8'),
+                                     ('domain', 'evil.com'), ('md5', 'd41d8cd98f00b204e9800998ecf8427e')]
+
+
+def test_chunked_stream_does_not_split_iocs():
+    text = "first 192.168.10.20 then malicious-1.example.com " * 50
+    chunks = (text[i:i + 7] for i in range(0, len(text), 7))
+    assert list(ExtractIOCs(chunked=True)(chunks)) == [{"type": "ipv4", "value": "192.168.10.20"},
+                                                       {"type": "domain", "value": "malicious-1.example.com"}]
+
+
+def test_bloom_filter_persists(tmp_path):
+    path = str(tmp_path / 'seen.bloom')
+    seen = BloomFilter(path, capacity=1000)
+    assert seen.add('ipv4:8.8.8.8') and not seen.add('ipv4:8.8.8.8')
+    seen.save()
+    assert 'ipv4:8.8.8.8' in BloomFilter(path) and 'ipv4:1.1.1.1' not in BloomFilter(path)
+
+
+@pytest.fixture
+def mongo_config():
+    client = mongomock.MongoClient()
+    with mock.patch.object(pymongo, 'MongoClient', lambda *args, **kwargs: client):
+        yield {"mongodb_uri": "mongodb://stand-in", "mongodb_database": "osintflow", "mongodb_collection": "iocs",
+               "mongodb_compare_field": "id"}, client.osintflow.iocs
+
+
+def ioc_job(base_url, configure, seen):
+    @osint.source_web(f"{base_url}/threatfox/offset?objects=50&limit=50")
+    @osint.dataflow(lambda body: [json.dumps(ioc) for ioc in json.loads(body)['data']], ExtractIOCs(seen=seen),
+                    Map(lambda ioc: {"custom_raw_data": dict(ioc, id=f"{ioc['type']}:{ioc['value']}")}))
+    @osint.store_mongo(configure)
+    def job():
+        return osint.data
+
+    return job
+
+
+def test_seen_set_is_only_updated_after_the_store_succeeded(tmp_path, base_url, mongo_config):
+    configure, collection = mongo_config
+    path = str(tmp_path / 'seen.bloom')
+    seen = BloomFilter(path, capacity=10000)
+    job = ioc_job(base_url, configure, seen)
+
+    with mock.patch.object(mongo_ops, '_bulk_write', side_effect=RuntimeError("store down")):
+        with pytest.raises(RuntimeError):
+            job()
+    assert len(seen) == 0
+
+    job()
+    stored = collection.count_documents({})
+    assert stored and len(seen) == stored and len(BloomFilter(path)) == stored
+
+    # a second run only finds IOCs it has already stored
+    collection.delete_many({})
+    job()
+    assert collection.count_documents({}) == 0
+
+
+def test_seen_set_commits_with_the_job_it_runs_in():
+    seen = BloomFilter(capacity=1000)
+    other = OsintflowJob()
+
+    @other.dataflow(lambda _: "c2 at 8.8.8.8", [ExtractIOCs(seen=seen)], executor='thread')
+    def job():
+        return other.data
+
+    assert job() == [[{"type": "ipv4", "value": "8.8.8.8"}]]
+    assert 'ipv4:8.8.8.8' in seen
+
+    # outside a job there is nothing that would ever commit the IOCs
+    with pytest.raises(ValueError):
+        ExtractIOCs(seen=seen)("c2 at 1.1.1.1")
+    assert 'ipv4:1.1.1.1' not in seen
@@ -0,0 +1,47 @@
+from osintflow import metrics
+from osintflow.core import osint
+from osintflow.stream import Map
+
+
+def run_with_metrics(job):
+    reports = []
+    metrics.enable(reports.append)
+    try:
+        result = job()
+    finally:
+        metrics.disable()
+    return result, reports[-1]
+
+
+def test_streamed_source_web_counts_fetched_bytes(base_url):
+    url = f"{base_url}/attack?objects=200"
+
+    @osint.source_web(url, stream='json', items='objects')
+    @osint.dataflow(Map(lambda obj: obj['id']))
+    def job():
+        return sum(1 for _ in osint.data)
+
+    @osint.source_web(url)
+    def eager_job():
+        return len(osint.raw)
+
+    records, report = run_with_metrics(job)
+    size, eager_report = run_with_metrics(eager_job)
+    assert records == 200
+    assert report['stages']['source_web.fetch']['bytes_in'] == size
+    assert eager_report['stages']['source_web.fetch']['bytes_in'] == size
+
+
+def test_samples_after_the_job_finished_are_dropped(base_url):
+    recorders = []
+
+    @osint.source_web(f"{base_url}/attack?objects=50", stream='json', items='objects')
+    def job():
+        # handed out unconsumed: read only after the job's report went out
+        recorders.append(metrics.recorder())
+        return osint.data
+
+    stream, report = run_with_metrics(job)
+    assert sum(1 for _ in stream) == 50
+    assert recorders[0].report()['stages'] == report['stages']
+    assert 'source_web.stream' not in report['stages']
@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from osintflow.core import osint
+
+Minio = pytest.importorskip('minio').Minio
+moto_server = pytest.importorskip('moto.server')
+
+from osintflow.minio import ops as minio_ops  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def minio_config():
+    # moto's S3 server as a local MinIO-compatible stand-in
+    server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    configure = {"minio_endpoint": f"{host}:{port}", "minio_access_key": "test", "minio_secret_key": "testtest",
+                 "minio_secure": False, "minio_bucket": "archive"}
+    Minio(configure['minio_endpoint'], access_key='test', secret_key='testtest',
+          secure=False).make_bucket('archive')
+    yield configure
+    server.stop()
+
+
+@pytest.fixture
+def client(minio_config):
+    return Minio(minio_config['minio_endpoint'], access_key='test', secret_key='testtest', secure=False)
+
+
+def test_pipe_reader_returns_exact_sizes():
+    pipe = minio_ops._PipeReader(max_chunks=16)
+    for i in range(10):
+        pipe.write(bytes([i]) * 3)
+    pipe.close()
+    assert pipe.read(4) == b'\x00\x00\x00\x01'
+    assert pipe.read(7) == b'\x01\x01\x02\x02\x02\x03\x03'
+    assert len(pipe.read()) == 19
+    assert pipe.read(5) == b''
+
+
+def test_multipart_upload_is_named_by_content_and_not_repeated(client):
+    # larger than one part, so the upload is multipart
+    payload = os.urandom(6 * 1024 * 1024)
+    first = minio_ops.put_bytes(client, 'archive', payload, prefix='raw/')
+    assert first['uploaded'] and first['object_name'].startswith('raw/')
+    assert client.get_object('archive', first['object_name']).read() == payload
+
+    writer = minio_ops.ObjectWriter(client, 'archive', prefix='raw/')
+    writer.write(payload)
+    second = writer.close()
+    assert second['object_name'] == first['object_name'] and not second['uploaded']
+    assert not [item for item in client.list_objects('archive', prefix='raw/.upload/', recursive=True)]
+
+
+def test_store_minio_archives_streamed_records(minio_config, client, base_url):
+    @osint.source_web(f"{base_url}/threatfox?objects=50", stream='json', items='data')
+    @osint.store_minio(minio_config, source='records', compression='gzip', prefix='records/')
+    def job():
+        return sum(1 for _ in osint.data)
+
+    assert job() == 50
+    stored = osint.stored_minio_log
+    lines = gzip.decompress(client.get_object('archive', stored['object_name']).read()).splitlines()
+    assert len(lines) == 50 and json.loads(lines[0])['ioc']
+
+
+def test_store_minio_archives_the_streamed_raw_body(minio_config, client, base_url):
+    url = f"{base_url}/threatfox?objects=50"
+
+    @osint.source_web(url, stream='json', items='data')
+    @osint.store_minio(minio_config, source='raw', prefix='raw/')
+    def job():
+        # stops early: the rest of the body is still archived
+        return next(osint.data)
+
+    @osint.source_web(url)
+    @osint.store_minio(minio_config, source='raw', prefix='raw/')
+    def eager_job():
+        return osint.raw
+
+    assert job()['ioc']
+    streamed = osint.stored_minio_log
+    body = eager_job()
+    assert client.get_object('archive', streamed['object_name']).read() == body
+    assert osint.stored_minio_log['object_name'] == streamed['object_name']
+    assert not osint.stored_minio_log['uploaded']
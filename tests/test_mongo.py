@@ -0,0 +1,96 @@
+import os
+import time
+from unittest import mock
+
+import pymongo
+import pytest
+from bson import json_util
+
+from osintflow import connection
+from osintflow.core import osint
+from osintflow.mongo import ops as mongo_ops
+from osintflow.stream import Map
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def mongo_config():
+    # pooled clients would outlive the stand-in of another test
+    connection.close()
+    client = mongomock.MongoClient()
+    with mock.patch.object(pymongo, 'MongoClient', lambda *args, **kwargs: client):
+        yield {"mongodb_uri": "mongodb://stand-in", "mongodb_database": "osintflow", "mongodb_collection": "iocs",
+               "mongodb_source_database": "osintflow", "mongodb_source_collection": "feed",
+               "mongodb_compare_field": "id", "mongodb_chunk_size": 50}, client.osintflow
+    connection.close()
+
+
+def failing_nth_bulk_write(n):
+    calls = []
+    bulk_write = mongo_ops._bulk_write
+
+    def _bulk_write(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == n:
+            raise pymongo.errors.AutoReconnect("connection lost")
+        return bulk_write(*args, **kwargs)
+
+    return _bulk_write
+
+
+@pytest.mark.parametrize('failing_write', [1, 3])
+def test_checkpoint_only_covers_written_documents(tmp_path, mongo_config, failing_write):
+    configure, database = mongo_config
+    database.feed.insert_many([{"_id": i, "custom_raw_data": {"id": i}} for i in range(200)])
+    path = str(tmp_path / 'feed.checkpoint')
+
+    def job():
+        @osint.source_mongo(configure, {}, projection={"_id": 0}, batch_size=10, checkpoint=path)
+        @osint.dataflow(Map(lambda document: {"custom_raw_data": document['custom_raw_data']}))
+        @osint.store_mongo(configure)
+        def run():
+            return osint.data
+
+        return run()
+
+    with mock.patch.object(mongo_ops, '_bulk_write', failing_nth_bulk_write(failing_write)):
+        with pytest.raises(pymongo.errors.AutoReconnect):
+            job()
+    stored = {document['custom_raw_data']['id'] for document in database.iocs.find()}
+    if os.path.exists(path):
+        with open(path) as f:
+            last_id = json_util.loads(f.read())['last_id']
+        # everything the checkpoint skips on the next run is already stored
+        assert set(range(last_id + 1)) <= stored
+    else:
+        assert failing_write == 1
+
+    job()
+    assert database.iocs.count_documents({}) == 200
+    with open(path) as f:
+        assert json_util.loads(f.read())['last_id'] == 199
+
+
+def test_chunks_sharing_compare_keys_wait_for_the_write_in_flight(mongo_config):
+    _, database = mongo_config
+    documents = [{"custom_raw_data": {"id": 1}}, {"custom_raw_data": {"id": 2}},
+                 {"custom_raw_data": {"id": 3, "malware": "v1"}},
+                 {"custom_raw_data": {"id": 3, "malware": "v2"}}, {"custom_raw_data": {"id": 4}},
+                 {"custom_raw_data": {"id": 5}},
+                 {"custom_raw_data": {"id": 5}}, {"custom_raw_data": {"id": 6}}, {"custom_raw_data": {"id": 7}}]
+    bulk_write = mongo_ops._bulk_write
+
+    def slow_bulk_write(*args, **kwargs):
+        # long enough for the next chunk's lookup to overtake the write if it did not wait
+        time.sleep(0.2)
+        return bulk_write(*args, **kwargs)
+
+    with mock.patch.object(mongo_ops, '_bulk_write', slow_bulk_write):
+        summary = mongo_ops.upsert_or_revoke_chunked(iter(documents), database.iocs, 'id', chunk_size=3)
+    assert summary.chunks == 3
+    current = [document['custom_raw_data'] for document in database.iocs.find({'revoked': False})]
+    assert sorted(document['id'] for document in current) == [1, 2, 3, 4, 5, 6, 7]
+    assert {"id": 3, "malware": "v2"} in current
+    assert database.iocs.count_documents({'revoked': True, 'custom_raw_data.id': 3}) == 1
+    assert database.iocs.count_documents({}) == 8
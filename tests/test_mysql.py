@@ -0,0 +1,58 @@
+import json
+
+import pytest
+import sqlalchemy
+
+from osintflow.core import osint
+from osintflow.mysql import ops as mysql_ops
+
+
+@pytest.fixture
+def sqlite_config(tmp_path):
+    # a SQLite file as the local MySQL stand-in
+    return {"mysql_url": f"sqlite:///{tmp_path}/iocs.db", "mysql_table": "iocs"}
+
+
+def fetch_rows(configure):
+    engine = sqlalchemy.create_engine(configure['mysql_url'])
+    with engine.connect() as connection:
+        return [dict(row._mapping) for row in connection.execute(sqlalchemy.text("SELECT * FROM iocs ORDER BY id"))]
+
+
+def test_bulk_load_upserts_and_takes_columns_from_the_whole_first_batch(sqlite_config):
+    engine = sqlalchemy.create_engine(sqlite_config['mysql_url'])
+    rows = [{"id": "1", "ioc": "1.2.3.4"}, {"id": "2", "ioc": "evil.com", "malware": "loader"}]
+    assert mysql_ops.bulk_load(rows, engine, 'iocs', compare_field='id')['rows'] == 2
+    mysql_ops.bulk_load([{"id": "1", "ioc": "1.2.3.5"}], engine, 'iocs', compare_field='id')
+    assert fetch_rows(sqlite_config) == [{"id": "1", "ioc": "1.2.3.5", "malware": None},
+                                         {"id": "2", "ioc": "evil.com", "malware": "loader"}]
+
+
+def test_bulk_load_raises_on_unknown_columns(sqlite_config):
+    engine = sqlalchemy.create_engine(sqlite_config['mysql_url'])
+    rows = [{"id": "1", "ioc": "1.2.3.4"}, {"id": "2", "ioc": "evil.com", "extra": "x"}]
+    with pytest.raises(ValueError):
+        mysql_ops.bulk_load(iter(rows), engine, 'iocs', compare_field='id', batch_size=1)
+
+
+def test_store_mysql_bulk_from_the_stand_in_server(sqlite_config, base_url):
+    @osint.source_web(f"{base_url}/threatfox/offset?objects=100&limit=100")
+    @osint.dataflow(json.loads, lambda body: [{"id": ioc['id'], "ioc": ioc['ioc']} for ioc in body['data']])
+    @osint.store_mysql(sqlite_config, compare_field='id', bulk=True, batch_size=30)
+    def job():
+        return osint.data
+
+    job()
+    assert len(fetch_rows(sqlite_config)) == 100
+    assert osint.stored_mysql_log['batches'] == 4
+
+
+def test_store_mysql_bulk_upsert_needs_compare_field(sqlite_config):
+    @osint.dataflow(lambda _: [{"id": "1"}])
+    @osint.store_mysql(sqlite_config, bulk=True)
+    def job():
+        return osint.data
+
+    osint.data = []
+    with pytest.raises(ValueError):
+        job()
@@ -0,0 +1,16 @@
+from osintflow import util
+from osintflow.dedupe import Deduplicator, dedupe
+
+
+def test_template_kwargs_are_visible_in_nested_scopes():
+    caller_globals = {'sep': '-'}
+    render = util.compile_template('<sep.join(str(i * n) for i in range(3))>/<(lambda: n)()>/<n>')
+    assert render({'n': 2}, caller_globals) == '0-2-4/2/2'
+    assert caller_globals == {'sep': '-'}
+
+
+def test_dedupe_key_reaches_into_custom_raw_data():
+    documents = [{"custom_raw_data": {"id": 1, "seen": "first"}}, {"custom_raw_data": {"id": 2}},
+                 {"custom_raw_data": {"id": 1, "seen": "last"}}]
+    assert dedupe(documents, ['custom_raw_data.id']) == documents[1:]
+    assert list(Deduplicator('custom_raw_data.id').iter(documents)) == documents[:2]
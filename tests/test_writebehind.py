@@ -0,0 +1,95 @@
+from unittest import mock
+
+import pymongo
+import pytest
+from bson import json_util
+
+from osintflow import connection
+from osintflow.core import osint
+from osintflow.mongo import writebehind
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def mongo_config(tmp_path):
+    connection.close()
+    client = mongomock.MongoClient()
+    with mock.patch.object(pymongo, 'MongoClient', lambda *args, **kwargs: client):
+        yield {"mongodb_uri": "mongodb://stand-in", "mongodb_database": "osintflow", "mongodb_collection": "iocs",
+               "mongodb_compare_field": "id", "mongodb_write_behind": True,
+               "mongodb_journal": str(tmp_path / 'iocs.journal')}, client.osintflow.iocs
+        writebehind.close()
+    connection.close()
+
+
+def read_journal(path):
+    with open(path) as f:
+        return [json_util.loads(line) for line in f if line.strip()]
+
+
+def test_journal_is_acknowledged_and_truncated_after_the_write(mongo_config):
+    configure, collection = mongo_config
+    writer = writebehind.WriteBehind(collection, journal=configure['mongodb_journal'])
+    writer.put([{"custom_raw_data": {"id": i}} for i in range(10)])
+    assert writer.flush(5)
+    assert collection.count_documents({}) == 10
+    assert read_journal(configure['mongodb_journal']) == []
+    writer.close()
+
+
+def test_unacknowledged_batches_are_replayed_once(mongo_config):
+    configure, collection = mongo_config
+    records = [{"_id": i, "custom_raw_data": {"id": i}} for i in range(6)]
+    with open(configure['mongodb_journal'], 'w') as f:
+        f.write(json_util.dumps({"seq": 1, "records": records[:3]}) + "\n")
+        f.write(json_util.dumps({"ack": 1}) + "\n")
+        f.write(json_util.dumps({"seq": 2, "records": records[3:]}) + "\n")
+        # crashed halfway through the next entry
+        f.write('{"seq": 3, "reco')
+    # the crash came between the write of batch 2 and its ack
+    collection.insert_one(records[3])
+
+    writer = writebehind.WriteBehind(collection, journal=configure['mongodb_journal'])
+    assert writer.flush(5)
+    assert sorted(document['_id'] for document in collection.find()) == [3, 4, 5]
+    assert writer.stats()['replayed'] == 3
+    assert read_journal(configure['mongodb_journal']) == []
+    writer.close()
+
+
+def test_failed_write_stays_in_the_journal(mongo_config):
+    configure, collection = mongo_config
+    writer = writebehind.WriteBehind(collection, journal=configure['mongodb_journal'])
+    with mock.patch.object(writebehind, '_insert_once', side_effect=pymongo.errors.AutoReconnect("down")):
+        writer.put([{"custom_raw_data": {"id": i}} for i in range(3)])
+        assert not writer.close(0.5)
+    assert collection.count_documents({}) == 0
+    assert [len(entry['records']) for entry in read_journal(configure['mongodb_journal'])] == [3]
+
+    writer = writebehind.WriteBehind(collection, journal=configure['mongodb_journal'])
+    assert writer.flush(5)
+    assert collection.count_documents({}) == 3
+    writer.close()
+
+
+def test_store_and_log_writers_keep_separate_journals(base_url, mongo_config):
+    configure, collection = mongo_config
+
+    @osint.store_log(configure)
+    @osint.source_web(f"{base_url}/threatfox/offset?objects=20&limit=20")
+    @osint.dataflow(lambda body: [{"custom_raw_data": ioc} for ioc in json_util.loads(body)['data']])
+    @osint.store_mongo(configure)
+    def job():
+        return osint.data
+
+    job()
+    with pytest.raises(ValueError):
+        writebehind.get(dict(configure, mongodb_collection='other'), 'id')
+    writebehind.close()
+    assert collection.count_documents({'custom_raw_data': {'$exists': True}}) == 20
+    assert collection.count_documents({'log': {'$exists': True}}) == 1
+    log = collection.find_one({'log': {'$exists': True}})['log']
+    assert sorted(log['stats']['write_behind']) == ["osintflow.iocs:id:" + configure['mongodb_journal']]
+    assert read_journal(configure['mongodb_journal']) == []
+    assert read_journal(configure['mongodb_journal'] + '.log') == []